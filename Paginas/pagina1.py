@@ -2,7 +2,10 @@ import streamlit as st
 import pandas as pd
 
 import plotly.express as px
-from utils.utils_datos import load_data
+from utils.utils_datos import load_data, version_datos
+from utils.utils_kpis import kpis_cacheados
+from utils.utils_figuras import figura_cacheada
+from utils.utils_rendimiento import render_tiempos
 
 
 # Título principal de la página
@@ -47,6 +50,138 @@ if df.empty:
     st.stop()
 
 
+# Todos los KPIs y tablas agrupadas de la página salen del motor de KPIs,
+# que recorre el DataFrame una sola vez y se cachea por versión de datos.
+version = version_datos(df)
+kpis = kpis_cacheados(df, version)
+kpi_global = kpis["global"].iloc[0]
+
+
+chart_height = 260  # tamaño estándar de gráficas
+
+
+# Funciones que construyen cada gráfica a partir de las tablas del motor de KPIs.
+# Se llaman a través de figura_cacheada, por lo que solo se ejecutan cuando
+# cambia la versión de los datos; en las demás visitas se reutiliza la figura.
+def fig_precio_ciudad(kpis):
+    precio_ciudad = (
+        kpis["ciudad"][["ciudad", "price_mean"]]
+        .rename(columns={"price_mean": "price"})
+        .sort_values("price", ascending=False)
+    )
+    precio_ciudad["ciudad"] = precio_ciudad["ciudad"].replace({
+        "Amsterdam": "Ámsterdam",
+        "Milan": "Milán"
+    })
+
+    fig = px.bar(precio_ciudad, x="ciudad", y="price", height=chart_height)
+    fig = compact(fig)
+    fig.update_xaxes(title="Ciudad")
+    fig.update_yaxes(title="Precio medio (€)")
+    return fig
+
+
+def fig_participacion_ciudad(kpis):
+    counts_ciudad = (
+        kpis["ciudad"][["ciudad", "listings"]]
+        .sort_values("listings", ascending=False)
+    )
+    counts_ciudad.columns = ["ciudad", "count"]
+    counts_ciudad["ciudad"] = counts_ciudad["ciudad"].replace({
+        "Amsterdam": "Ámsterdam",
+        "Milan": "Milán"
+    })
+
+    fig = px.pie(
+        counts_ciudad,
+        names="ciudad",
+        values="count",
+        hole=0.5,
+        height=chart_height,
+        color_discrete_sequence=[
+            "#FF7A85", "#FF5A5F", "#FF385C",
+            "#FFB400", "#00A699", "#FC642D"
+        ]
+    )
+    fig = compact(fig)
+    fig.update_traces(textinfo='percent+label')
+    fig.update_layout(legend_title_text="Ciudad")
+    return fig
+
+
+def fig_rating_ciudad(kpis):
+    rat_ciudad = (
+        kpis["ciudad"][["ciudad", "rating_mean"]]
+        .rename(columns={"rating_mean": "review_scores_rating"})
+        .dropna(subset=["review_scores_rating"])
+        .sort_values("review_scores_rating")
+    )
+    rat_ciudad["ciudad"] = rat_ciudad["ciudad"].replace({
+        "Amsterdam": "Ámsterdam",
+        "Milan": "Milán"
+    })
+
+    fig = px.bar(
+        rat_ciudad, x="review_scores_rating", y="ciudad",
+        orientation="h", height=chart_height
+    )
+    fig = compact(fig)
+    fig.update_xaxes(title="Rating medio")
+    fig.update_yaxes(title="Ciudad")
+    return fig
+
+
+def fig_precio_capacidad(kpis):
+    grp_p = (
+        kpis["capacidad"][["accommodates", "price_mean"]]
+        .rename(columns={"price_mean": "price"})
+        .sort_values("accommodates")
+    )
+    grp_p = grp_p[grp_p["accommodates"] <= 8]
+
+    fig = compact(px.line(grp_p, x="accommodates", y="price"))
+    fig.update_xaxes(title="Capacidad (personas)")
+    fig.update_yaxes(title="Precio medio (€)")
+    return fig
+
+
+def fig_rating_capacidad(kpis):
+    grp_r = (
+        kpis["capacidad"][["accommodates", "rating_mean"]]
+        .rename(columns={"rating_mean": "review_scores_rating"})
+        .dropna(subset=["review_scores_rating"])
+        .sort_values("accommodates")
+    )
+    grp_r = grp_r[grp_r["accommodates"] <= 8]
+
+    fig = compact(px.line(grp_r, x="accommodates", y="review_scores_rating"))
+    fig.update_xaxes(title="Capacidad (personas)")
+    fig.update_yaxes(title="Rating medio")
+    return fig
+
+
+def fig_room_types(kpis):
+    rt = (
+        kpis["room_type"][["room_type", "listings"]]
+        .sort_values("listings", ascending=False)
+    )
+    rt.columns = ["room_type", "count"]
+
+    fig = compact(px.bar(rt, x="room_type", y="count"))
+    fig.update_xaxes(title="Tipo de habitación")
+    fig.update_yaxes(title="Cantidad de listings")
+    return fig
+
+
+def grafica(chart_id, construir):
+    """
+    Muestra una gráfica de la página usando la caché de figuras
+    (llave: versión de datos + id de gráfica).
+    """
+    fig = figura_cacheada(f"pagina1/{chart_id}", version, {}, lambda: construir(kpis))
+    st.plotly_chart(fig, use_container_width=True, key=chart_id)
+
+
 # División de la interfaz en dos secciones:
 # columna izquierda → métricas
 # columna derecha → gráficos comparativos
@@ -96,24 +231,15 @@ with col_left:
 
     # Lista de métricas calculadas en todo el dataset
     kpi_labels = [
-        ("Listings", len(df)),  # número total de propiedades en el dataset
-        ("€Precio medio", f"{df['price'].mean():.2f}" if "price" in df else "N/A"),
-        ("Rating medio", f"{df['review_scores_rating'].mean():.2f}" if "review_scores_rating" in df else "N/A"),
-        ("€ por persona", f"{df['price_per_person'].mean():.2f}" if "price_per_person" in df else "N/A"),
+        ("Listings", int(kpi_global["listings"])),  # número total de propiedades en el dataset
+        ("€Precio medio", f"{kpi_global['price_mean']:.2f}" if "price" in df else "N/A"),
+        ("Rating medio", f"{kpi_global['rating_mean']:.2f}" if "review_scores_rating" in df else "N/A"),
+        ("€ por persona", f"{kpi_global['ppp_mean']:.2f}" if "price_per_person" in df else "N/A"),
     ]
 
-    # Cálculo de porcentaje de superhosts solo si existe dicha columna
-    if "host_is_superhost" in df.columns:
-        pct_superhost = (
-            100 *
-            df["host_is_superhost"]
-            .astype(str)
-            .str.lower()
-            .str.strip()
-            .eq('t')
-            .mean()
-        )
-        kpi_labels.append(("% Superhosts", f"{pct_superhost:.1f}%"))
+    # Porcentaje de superhosts solo si existe dicha columna
+    if "es_superhost" in df.columns:
+        kpi_labels.append(("% Superhosts", f"{kpi_global['pct_superhost']:.1f}%"))
     else:
         kpi_labels.append(("% Superhosts", "N/A"))
 
@@ -129,8 +255,6 @@ with col_left:
 with col_right:
     st.markdown('<div class="charts-col">', unsafe_allow_html=True)
 
-    chart_height = 260  # tamaño estándar de gráficas
-
     # Primera fila de visualizaciones comparativas por ciudad
     c11, c12, c13 = st.columns([1, 1, 1])
 
@@ -141,22 +265,7 @@ with col_right:
                 "<div style='text-align:center; font-weight:bold;'>Precio medio por ciudad</div>",
                 unsafe_allow_html=True
             )
-            precio_ciudad = (
-                df.groupby("ciudad")["price"]
-                .mean()
-                .sort_values(ascending=False)
-                .reset_index()
-            )
-            precio_ciudad["ciudad"] = precio_ciudad["ciudad"].replace({
-                "Amsterdam": "Ámsterdam",
-                "Milan": "Milán"
-            })
-
-            fig = px.bar(precio_ciudad, x="ciudad", y="price", height=chart_height)
-            fig = compact(fig)
-            fig.update_xaxes(title="Ciudad")
-            fig.update_yaxes(title="Precio medio (€)")
-            st.plotly_chart(fig, use_container_width=True, key="precio_ciudad")
+            grafica("precio_ciudad", fig_precio_ciudad)
 
     # Gráfico 2: Participación porcentual de listings por ciudad
     with c12:
@@ -165,29 +274,7 @@ with col_right:
                 "<div style='text-align:center; font-weight:bold;'>Participación de listings por ciudad</div>",
                 unsafe_allow_html=True
             )
-            counts_ciudad = (
-                df["ciudad"]
-                .replace({"Amsterdam": "Ámsterdam", "Milan": "Milán"})
-                .value_counts()
-                .reset_index()
-            )
-            counts_ciudad.columns = ["ciudad", "count"]
-
-            fig = px.pie(
-                counts_ciudad,
-                names="ciudad",
-                values="count",
-                hole=0.5,
-                height=chart_height,
-                color_discrete_sequence=[
-                    "#FF7A85", "#FF5A5F", "#FF385C",
-                    "#FFB400", "#00A699", "#FC642D"
-                ]
-            )
-            fig = compact(fig)
-            fig.update_traces(textinfo='percent+label')
-            fig.update_layout(legend_title_text="Ciudad")
-            st.plotly_chart(fig, use_container_width=True, key="participacion_ciudad")
+            grafica("participacion_ciudad", fig_participacion_ciudad)
 
     # Gráfico 3: Rating promedio por ciudad
     with c13:
@@ -196,26 +283,7 @@ with col_right:
                 "<div style='text-align:center; font-weight:bold;'>Rating medio por ciudad</div>",
                 unsafe_allow_html=True
             )
-            rat_ciudad = (
-                df.dropna(subset=["review_scores_rating"])
-                .groupby("ciudad")["review_scores_rating"]
-                .mean()
-                .sort_values()
-                .reset_index()
-            )
-            rat_ciudad["ciudad"] = rat_ciudad["ciudad"].replace({
-                "Amsterdam": "Ámsterdam",
-                "Milan": "Milán"
-            })
-
-            fig = px.bar(
-                rat_ciudad, x="review_scores_rating", y="ciudad",
-                orientation="h", height=chart_height
-            )
-            fig = compact(fig)
-            fig.update_xaxes(title="Rating medio")
-            fig.update_yaxes(title="Ciudad")
-            st.plotly_chart(fig, use_container_width=True, key="rating_ciudad")
+            grafica("rating_ciudad", fig_rating_ciudad)
 
     # Segunda fila: relación de métricas con capacidad de hospedaje
     c21, c22, c23 = st.columns(3)
@@ -227,18 +295,7 @@ with col_right:
                 "<div style='text-align:center; font-weight:bold;'>Precio medio según capacidad</div>",
                 unsafe_allow_html=True
             )
-            grp_p = (
-                df.groupby("accommodates")["price"]
-                .mean()
-                .sort_index()
-                .reset_index()
-            )
-            grp_p = grp_p[grp_p["accommodates"] <= 8]
-
-            fig = compact(px.line(grp_p, x="accommodates", y="price"))
-            fig.update_xaxes(title="Capacidad (personas)")
-            fig.update_yaxes(title="Precio medio (€)")
-            st.plotly_chart(fig, use_container_width=True, key="precio_capacidad")
+            grafica("precio_capacidad", fig_precio_capacidad)
 
     # Gráfico 5: Rating promedio por capacidad
     with c22:
@@ -247,19 +304,7 @@ with col_right:
                 "<div style='text-align:center; font-weight:bold;'>Rating medio según capacidad</div>",
                 unsafe_allow_html=True
             )
-            grp_r = (
-                df.dropna(subset=["review_scores_rating"])
-                .groupby("accommodates")["review_scores_rating"]
-                .mean()
-                .sort_index()
-                .reset_index()
-            )
-            grp_r = grp_r[grp_r["accommodates"] <= 8]
-
-            fig = compact(px.line(grp_r, x="accommodates", y="review_scores_rating"))
-            fig.update_xaxes(title="Capacidad (personas)")
-            fig.update_yaxes(title="Rating medio")
-            st.plotly_chart(fig, use_container_width=True, key="rating_capacidad")
+            grafica("rating_capacidad", fig_rating_capacidad)
 
     # Gráfico 6: Distribución global de tipos de habitación
     with c23:
@@ -268,15 +313,10 @@ with col_right:
                 "<div style='text-align:center; font-weight:bold;'>Room types (global)</div>",
                 unsafe_allow_html=True
             )
-            rt = df["room_type"].value_counts().reset_index()
-            rt.columns = ["room_type", "count"]
-
-            fig = compact(px.bar(rt, x="room_type", y="count"))
-            fig.update_xaxes(title="Tipo de habitación")
-            fig.update_yaxes(title="Cantidad de listings")
-            st.plotly_chart(fig, use_container_width=True, key="room_types_global")
+            grafica("room_types_global", fig_room_types)
 
     st.markdown('</div>', unsafe_allow_html=True)
 
 
-
+# Panel con tiempos de ejecución y métricas de la caché de figuras
+render_tiempos()
@@ -1,8 +1,12 @@
 import streamlit as st
 import pandas as pd
 import plotly.express as px
-from utils.utils_datos import load_data
-import plotly.express as px
+from utils.utils_datos import load_data, filtrar_con_version, version_datos
+from utils.utils_kpis import kpis_cacheados, kpis_ciudad
+from utils.utils_figuras import figura_cacheada
+from utils.utils_rendimiento import render_tiempos
+from utils.extraccion_mapas import figura_mapa
+from utils.utils_estadisticas import preparar_puntos_dispersion
 
 
 st.title('KPIs Por Ciudades')
@@ -43,183 +47,235 @@ def compact(fig):
     fig.update_yaxes(title=None)
     return fig
 
-tabs = st.tabs(ciudades_labels)
-
-for i, (tab, ciudad_label, ciudad_original) in enumerate(zip(tabs, ciudades_labels, ciudades_originales)):
-    with tab:
-        df_city = df[df["ciudad"] == ciudad_original].copy()
-        if df_city.empty:
-            st.info(f"Sin datos para {ciudad_label}.")
-            st.stop()
-        # KPIs por ciudad en fila horizontal (como antes)
-        # Título eliminado, solo KPIs centrados
-        # KPIs y gráficas juntos en la parte superior
-        # KPIs y gráficas principales en la misma fila
-        col_kpi, col_graficas = st.columns([2, 6], gap="large")
-        with col_kpi:
-            st.markdown('<div class="kpi-col">', unsafe_allow_html=True)
-            st.markdown("""
-                <style>
-                div[data-testid='stMetric'] {
-                    text-align: center !important;
-                }
-                div[data-testid='stMetric'] > label, div[data-testid='stMetric'] > div {
-                    width: 100%;
-                    justify-content: center;
-                    text-align: center !important;
-                    display: flex;
-                    flex-direction: column;
-                    align-items: center;
-                }
-                </style>
-            """, unsafe_allow_html=True)
-            kpi_labels = [
-                ("Listings", len(df_city)),
-                ("€Precio medio", f"{df_city['price'].mean():.2f}" if "price" in df_city.columns else "N/A"),
-                ("Rating medio", f"{df_city['review_scores_rating'].mean():.2f}" if "review_scores_rating" in df_city.columns else "N/A"),
-                ("€ por persona", f"{df_city['price_per_person'].mean():.2f}" if "price_per_person" in df_city.columns else "N/A"),
-            ]
-            if "host_is_superhost" in df_city.columns:
-                pct_superhost = 100 * df_city["host_is_superhost"].astype(str).str.lower().str.strip().eq('t').mean()
-                kpi_labels.append(("% Superhosts", f"{pct_superhost:.1f}%"))
+
+# Funciones que construyen las gráficas de una ciudad.
+# Se invocan a través de figura_cacheada con la ciudad como parámetro,
+# así que una ciudad ya visitada no vuelve a pasar por Plotly Express.
+def fig_precio_capacidad(kpis, ciudad_original):
+    capacidad = kpis_ciudad(kpis, "ciudad_capacidad", ciudad_original).set_index("accommodates")
+    all_caps = pd.Series(range(int(capacidad.index.min()), int(capacidad.index.max())+1))
+    precio_cap = capacidad["price_mean"].reindex(all_caps).reset_index()
+    precio_cap.columns = ["accommodates", "price"]
+    if ciudad_original.lower() == "amsterdam":
+        precio_cap["price"] = precio_cap["price"].interpolate(method="linear")
+    fig_precio_cap = px.line(precio_cap, x="accommodates", y="price", markers=True, title="Precio medio según capacidad")
+    fig_precio_cap.update_traces(line_color="#FF5A5F")
+    fig_precio_cap.update_layout(height=250, margin=dict(l=10, r=10, t=40, b=10))
+    fig_precio_cap.update_xaxes(title="Capacidad")
+    fig_precio_cap.update_yaxes(title="Precio medio (€)")
+    return fig_precio_cap
+
+
+def fig_rating_capacidad(kpis, ciudad_original):
+    rating_cap = (
+        kpis_ciudad(kpis, "ciudad_capacidad", ciudad_original)[["accommodates", "rating_mean"]]
+        .rename(columns={"rating_mean": "review_scores_rating"})
+        .sort_values("accommodates")
+    )
+    fig_rating_cap = px.line(rating_cap, x="accommodates", y="review_scores_rating", markers=True, title="Rating medio según capacidad")
+    fig_rating_cap.update_traces(line_color="#FF7A85")
+    fig_rating_cap.update_layout(height=250, margin=dict(l=10, r=10, t=40, b=10))
+    fig_rating_cap.update_xaxes(title="Capacidad")
+    fig_rating_cap.update_yaxes(title="Rating medio")
+    return fig_rating_cap
+
+
+def fig_precio_rating(df_city):
+    # Muestra por rejilla acotada y WebGL: el costo no crece con el número de listings
+    puntos = preparar_puntos_dispersion(df_city, "price", "review_scores_rating")
+    fig_precio_rating = px.scatter(puntos, x="price", y="review_scores_rating", opacity=0.5, color_discrete_sequence=["#FF385C"], render_mode="webgl")
+    fig_precio_rating.update_traces(marker=dict(size=6))
+    fig_precio_rating.update_layout(title="Relación precio vs rating", height=250, margin=dict(l=10, r=10, t=40, b=10))
+    fig_precio_rating.update_xaxes(title="Precio (€)")
+    fig_precio_rating.update_yaxes(title="Rating")
+    return fig_precio_rating
+
+
+def fig_precio_barrio(kpis, ciudad_original, chart_height):
+    agr = kpis_ciudad(kpis, "ciudad_barrio", ciudad_original)[
+        ["barrio_std", "listings", "price_mean", "rating_mean", "reviews_mean", "amenities_mean"]
+    ]
+    top_price = agr.sort_values("price_mean", ascending=False)
+    fig = px.bar(top_price, x="barrio_std", y="price_mean", height=chart_height)
+    fig.update_layout(margin=dict(l=10, r=10, t=10, b=10))
+    fig.update_xaxes(title="Barrio")
+    fig.update_yaxes(title="Precio medio (€)")
+    return fig
+
+
+def fig_room_types(rt, chart_height):
+    fig = px.pie(rt, names="room_type", values="count", hole=0.4, height=chart_height, color_discrete_sequence=["#FF7A85", "#FF5A5F", "#FF385C", "#FFB400", "#00A699", "#FC642D"])
+    fig.update_layout(margin=dict(l=10, r=10, t=10, b=10), legend=dict(font=dict(size=14), orientation="h", y=-0.2))
+    fig.update_traces(textinfo='percent+label')
+    fig.update_layout(legend_title_text="Tipo de habitación")
+    return fig
+
+
+def fig_mapa_superhosts(df_geo_superhost, ciudad_label):
+    hover_superhost = {}
+    if "barrio_std" in df_geo_superhost.columns:
+        hover_superhost["barrio_std"] = True
+    if "price" in df_geo_superhost.columns:
+        hover_superhost["price"] = True
+    # Centro y zoom fijos; con muchos superhosts el mapa se agrega en celdas por conteo.
+    # Sin color: todos los puntos son superhosts (filtrados con es_superhost)
+    lat_center = df_geo_superhost["latitude"].mean()
+    lon_center = df_geo_superhost["longitude"].mean()
+    fig_map = figura_mapa(
+        df_geo_superhost,
+        hover_name="barrio_std" if "barrio_std" in df_geo_superhost.columns else None,
+        hover_data=hover_superhost,
+        mapbox_style="carto-positron",
+        title=f"Distribución Geográfica de Superhosts - {ciudad_label} ({len(df_geo_superhost):,} puntos)",
+        height=500,
+        zoom=12,
+        center={"lat": lat_center, "lon": lon_center},
+        tamano_punto=9,
+        opacidad=0.7,
+    )
+    return fig_map
+
+
+def render_ciudad(df_city, kpis, ciudad_label, ciudad_original, i):
+    """
+    Renderiza KPIs, gráficas y mapa de superhosts de una sola ciudad.
+
+    Solo se llama para la ciudad activa, de modo que cada vista cuesta
+    el cómputo y el envío de figuras de una ciudad y no de todas.
+    Los KPIs y tablas agregadas se leen del motor de KPIs (kpis) y las
+    figuras de la caché de figuras, con llave versión de datos + ciudad.
+    """
+    version = version_datos(df_city)
+    params = {"ciudad": ciudad_original}
+
+    kpi_city = kpis_ciudad(kpis, "ciudad", ciudad_original).iloc[0]
+    col_kpi, col_graficas = st.columns([2, 6], gap="large")
+    with col_kpi:
+        st.markdown('<div class="kpi-col">', unsafe_allow_html=True)
+        st.markdown("""
+            <style>
+            div[data-testid='stMetric'] {
+                text-align: center !important;
+            }
+            div[data-testid='stMetric'] > label, div[data-testid='stMetric'] > div {
+                width: 100%;
+                justify-content: center;
+                text-align: center !important;
+                display: flex;
+                flex-direction: column;
+                align-items: center;
+            }
+            </style>
+        """, unsafe_allow_html=True)
+        kpi_labels = [
+            ("Listings", int(kpi_city["listings"])),
+            ("€Precio medio", f"{kpi_city['price_mean']:.2f}" if "price" in df_city.columns else "N/A"),
+            ("Rating medio", f"{kpi_city['rating_mean']:.2f}" if "review_scores_rating" in df_city.columns else "N/A"),
+            ("€ por persona", f"{kpi_city['ppp_mean']:.2f}" if "price_per_person" in df_city.columns else "N/A"),
+        ]
+        if "es_superhost" in df_city.columns:
+            kpi_labels.append(("% Superhosts", f"{kpi_city['pct_superhost']:.1f}%"))
+        else:
+            kpi_labels.append(("% Superhosts", "N/A"))
+        for label, value in kpi_labels:
+            with st.container(border=True):
+                st.metric(label, value)
+        st.markdown('</div>', unsafe_allow_html=True)
+    with col_graficas:
+        st.markdown("#### Análisis de capacidad y rating")
+        # Gráficas principales alineadas a la derecha de los KPIs
+        col1, col2, col3 = st.columns(3)
+        # 1. Precio medio por capacidad
+        with col1:
+            if "accommodates" in df_city.columns and "price" in df_city.columns:
+                fig_precio_cap = figura_cacheada("pagina2/precio_cap", version, params, lambda: fig_precio_capacidad(kpis, ciudad_original))
+                st.plotly_chart(fig_precio_cap, use_container_width=True, key=f"precio_cap_{ciudad_original}_top")
             else:
-                kpi_labels.append(("% Superhosts", "N/A"))
-            for label, value in kpi_labels:
-                with st.container(border=True):
-                    st.metric(label, value)
-            st.markdown('</div>', unsafe_allow_html=True)
-        with col_graficas:
-            st.markdown("#### Análisis de capacidad y rating")
-            # Gráficas principales alineadas a la derecha de los KPIs
-            col1, col2, col3 = st.columns(3)
-            # 1. Precio medio por capacidad
-            with col1:
-                if "accommodates" in df_city.columns and "price" in df_city.columns:
-                    all_caps = pd.Series(range(int(df_city["accommodates"].min()), int(df_city["accommodates"].max())+1))
-                    precio_cap = df_city.groupby("accommodates")["price"].mean().reindex(all_caps).reset_index()
-                    precio_cap.columns = ["accommodates", "price"]
-                    if ciudad_original.lower() == "amsterdam":
-                        precio_cap["price"] = precio_cap["price"].interpolate(method="linear")
-                    fig_precio_cap = px.line(precio_cap, x="accommodates", y="price", markers=True, title="Precio medio según capacidad")
-                    fig_precio_cap.update_traces(line_color="#FF5A5F")
-                    fig_precio_cap.update_layout(height=250, margin=dict(l=10, r=10, t=40, b=10))
-                    fig_precio_cap.update_xaxes(title="Capacidad")
-                    fig_precio_cap.update_yaxes(title="Precio medio (€)")
-                    st.plotly_chart(fig_precio_cap, use_container_width=True, key=f"precio_cap_{ciudad_original}_top")
-                else:
-                    st.info("No hay datos suficientes para precio por capacidad.")
-            # 2. Rating medio por capacidad
-            with col2:
-                if "accommodates" in df_city.columns and "review_scores_rating" in df_city.columns:
-                    rating_cap = df_city.groupby("accommodates")["review_scores_rating"].mean().reset_index()
-                    fig_rating_cap = px.line(rating_cap, x="accommodates", y="review_scores_rating", markers=True, title="Rating medio según capacidad")
-                    fig_rating_cap.update_traces(line_color="#FF7A85")
-                    fig_rating_cap.update_layout(height=250, margin=dict(l=10, r=10, t=40, b=10))
-                    fig_rating_cap.update_xaxes(title="Capacidad")
-                    fig_rating_cap.update_yaxes(title="Rating medio")
-                    st.plotly_chart(fig_rating_cap, use_container_width=True, key=f"rating_cap_{ciudad_original}_top")
-                else:
-                    st.info("No hay datos suficientes para rating por capacidad.")
-            # 3. Relación precio vs rating
-            with col3:
-                if "price" in df_city.columns and "review_scores_rating" in df_city.columns:
-                    fig_precio_rating = px.scatter(df_city, x="price", y="review_scores_rating", opacity=0.5, color_discrete_sequence=["#FF385C"])
-                    fig_precio_rating.update_traces(marker=dict(size=6))
-                    fig_precio_rating.update_layout(title="Relación precio vs rating", height=250, margin=dict(l=10, r=10, t=40, b=10))
-                    fig_precio_rating.update_xaxes(title="Precio (€)")
-                    fig_precio_rating.update_yaxes(title="Rating")
-                    st.plotly_chart(fig_precio_rating, use_container_width=True, key=f"precio_rating_{ciudad_original}_top")
-                else:
-                    st.info("No hay datos suficientes para relación precio-rating.")
-            # Gráficas adicionales debajo de las principales
-            g1, g2 = st.columns(2)
-            chart_height = 350
-            # 1) Precio medio por barrio
-            with g1:
-                st.markdown("<div style='text-align:center; font-weight:bold;'>Precio medio por barrio</div>", unsafe_allow_html=True)
-                agr = df_city.groupby("barrio_std", dropna=True).agg(
-                    listings=("id", "count"),
-                    price_mean=("price", "mean"),
-                    rating_mean=("review_scores_rating", "mean"),
-                    reviews_mean=("number_of_reviews_ltm", "mean"),
-                    amenities_mean=("amenities_count", "mean"),
-                ).reset_index()
-                top_price = agr.sort_values("price_mean", ascending=False)
-                fig = px.bar(top_price, x="barrio_std", y="price_mean", height=chart_height)
-                fig.update_layout(margin=dict(l=10, r=10, t=10, b=10))
-                fig.update_xaxes(title="Barrio")
-                fig.update_yaxes(title="Precio medio (€)")
-                st.plotly_chart(fig, use_container_width=True, key=f"barrios_{ciudad_original}")
-            # 2) Room types en barrios seleccionados
-            with g2:
-                if "room_type" in df_city.columns:
-                    st.markdown("<div style='text-align:center; font-weight:bold;'>Room types en barrios seleccionados</div>", unsafe_allow_html=True)
-                    rt = df_city["room_type"].value_counts().reset_index()
-                    rt.columns = ["room_type", "count"]
-                    if not rt.empty:
-                        fig = px.pie(rt, names="room_type", values="count", hole=0.4, height=chart_height, color_discrete_sequence=["#FF7A85", "#FF5A5F", "#FF385C", "#FFB400", "#00A699", "#FC642D"])
-                        fig.update_layout(margin=dict(l=10, r=10, t=10, b=10), legend=dict(font=dict(size=14), orientation="h", y=-0.2))
-                        fig.update_traces(textinfo='percent+label')
-                        fig.update_layout(legend_title_text="Tipo de habitación")
-                        st.plotly_chart(fig, use_container_width=True, key=f"roomtypes_{ciudad_original}")
-                    else:
-                        st.info("No hay room types disponibles para estos filtros.")
-                else:
-                    st.info("No existe la columna 'room_type' en los datos.")
-
-
-
-        # --- MAPA DE SUPERHOSTS (al final) ---
-        st.markdown("---")
-        superhost_container = st.container()
-        with superhost_container:
-            if {"latitude", "longitude", "host_is_superhost"}.issubset(df_city.columns):
-                df_geo_superhost = df_city[df_city["host_is_superhost"].astype(str).str.lower().str.strip() == 't'].copy()
-                # Filtrar valores nulos en lat/lon
-                df_geo_superhost = df_geo_superhost.dropna(subset=["latitude", "longitude"])
-                # Rango específico por ciudad para evitar filtrar todo por error
-                if ciudad_original.lower() == "amsterdam":
-                    df_geo_superhost = df_geo_superhost[(df_geo_superhost["latitude"].between(52.2, 52.5)) & (df_geo_superhost["longitude"].between(4.7, 5.1))]
-                elif ciudad_original.lower() == "milan":
-                    df_geo_superhost = df_geo_superhost[(df_geo_superhost["latitude"].between(45.3, 45.6)) & (df_geo_superhost["longitude"].between(9.0, 9.4))]
-                # Para otras ciudades, solo filtrar nulos
-                if len(df_geo_superhost) == 0:
-                    st.warning("No hay superhosts para mostrar en el mapa.")
+                st.info("No hay datos suficientes para precio por capacidad.")
+        # 2. Rating medio por capacidad
+        with col2:
+            if "accommodates" in df_city.columns and "review_scores_rating" in df_city.columns:
+                fig_rating_cap = figura_cacheada("pagina2/rating_cap", version, params, lambda: fig_rating_capacidad(kpis, ciudad_original))
+                st.plotly_chart(fig_rating_cap, use_container_width=True, key=f"rating_cap_{ciudad_original}_top")
+            else:
+                st.info("No hay datos suficientes para rating por capacidad.")
+        # 3. Relación precio vs rating
+        with col3:
+            if "price" in df_city.columns and "review_scores_rating" in df_city.columns:
+                fig_scatter = figura_cacheada("pagina2/precio_rating", version, params, lambda: fig_precio_rating(df_city))
+                st.plotly_chart(fig_scatter, use_container_width=True, key=f"precio_rating_{ciudad_original}_top")
+            else:
+                st.info("No hay datos suficientes para relación precio-rating.")
+        # Gráficas adicionales debajo de las principales
+        g1, g2 = st.columns(2)
+        chart_height = 350
+        # 1) Precio medio por barrio
+        with g1:
+            st.markdown("<div style='text-align:center; font-weight:bold;'>Precio medio por barrio</div>", unsafe_allow_html=True)
+            fig = figura_cacheada("pagina2/barrios", version, params, lambda: fig_precio_barrio(kpis, ciudad_original, chart_height))
+            st.plotly_chart(fig, use_container_width=True, key=f"barrios_{ciudad_original}")
+        # 2) Room types en barrios seleccionados
+        with g2:
+            if "room_type" in df_city.columns:
+                st.markdown("<div style='text-align:center; font-weight:bold;'>Room types en barrios seleccionados</div>", unsafe_allow_html=True)
+                rt = (
+                    kpis_ciudad(kpis, "ciudad_room_type", ciudad_original)[["room_type", "listings"]]
+                    .sort_values("listings", ascending=False)
+                )
+                rt.columns = ["room_type", "count"]
+                if not rt.empty:
+                    fig = figura_cacheada("pagina2/roomtypes", version, params, lambda: fig_room_types(rt, chart_height))
+                    st.plotly_chart(fig, use_container_width=True, key=f"roomtypes_{ciudad_original}")
                 else:
-                    hover_superhost = {}
-                    if "barrio_std" in df_geo_superhost.columns:
-                        hover_superhost["barrio_std"] = True
-                    if "price" in df_geo_superhost.columns:
-                        hover_superhost["price"] = True
-                    fig_map = px.scatter_mapbox(
-                        df_geo_superhost, lat="latitude", lon="longitude",
-                        color="host_is_superhost",
-                        hover_name="barrio_std" if "barrio_std" in df_geo_superhost.columns else None,
-                        hover_data=hover_superhost,
-                        mapbox_style="carto-positron",
-                        title=f"Distribución Geográfica de Superhosts - {ciudad_label} ({len(df_geo_superhost):,} puntos)",
-                        height=500
-                    )
-                    # Forzar centro y zoom si hay datos
-                    if not df_geo_superhost.empty:
-                        lat_center = df_geo_superhost["latitude"].mean()
-                        lon_center = df_geo_superhost["longitude"].mean()
-                        fig_map.update_layout(mapbox_center={"lat": lat_center, "lon": lon_center}, mapbox_zoom=12)
-                        fig_map.update_traces(marker=dict(size=9, opacity=0.7))
-                    st.plotly_chart(fig_map, use_container_width=True, key=f"tab{i}_map_{ciudad_label}_main")
+                    st.info("No hay room types disponibles para estos filtros.")
             else:
-                st.info("No hay información de superhosts para mostrar en el mapa.")
-
-        # División para contenido adicional
-        st.markdown("<div id='extra-content'></div>", unsafe_allow_html=True)
+                st.info("No existe la columna 'room_type' en los datos.")
 
 
 
+    # --- MAPA DE SUPERHOSTS (al final) ---
+    st.markdown("---")
+    superhost_container = st.container()
+    with superhost_container:
+        if {"latitude", "longitude", "es_superhost"}.issubset(df_city.columns):
+            df_geo_superhost = df_city[df_city["es_superhost"]].copy()
+            # Las coordenadas fuera de la ciudad ya se anularon en la carga
+            # (utils_datos.validar_coordenadas); solo se descartan nulos
+            df_geo_superhost = df_geo_superhost.dropna(subset=["latitude", "longitude"])
+            if len(df_geo_superhost) == 0:
+                st.warning("No hay superhosts para mostrar en el mapa.")
+            else:
+                fig_map = figura_cacheada("pagina2/mapa_superhosts", version, params, lambda: fig_mapa_superhosts(df_geo_superhost, ciudad_label))
+                st.plotly_chart(fig_map, use_container_width=True, key=f"tab{i}_map_{ciudad_label}_main")
+        else:
+            st.info("No hay información de superhosts para mostrar en el mapa.")
 
-        
+    # División para contenido adicional
+    st.markdown("<div id='extra-content'></div>", unsafe_allow_html=True)
 
 
+# Selector de ciudad en lugar de st.tabs: con pestañas se calculaban y enviaban
+# al navegador las figuras de todas las ciudades aunque solo se viera una.
+# Con el selector solo se procesa el panel de la ciudad activa.
+ciudad_label = st.radio(
+    "Ciudad",
+    ciudades_labels,
+    horizontal=True,
+    label_visibility="collapsed",
+    key="ciudad_activa_kpis",
+)
+i = ciudades_labels.index(ciudad_label)
+ciudad_original = ciudades_originales[i]
 
+df_city = filtrar_con_version(df, df["ciudad"] == ciudad_original, ciudad_original)
+if df_city.empty:
+    st.info(f"Sin datos para {ciudad_label}.")
+    st.stop()
 
+# Motor de KPIs sobre el dataset completo, cacheado por versión de datos
+kpis = kpis_cacheados(df, version_datos(df))
 
+render_ciudad(df_city, kpis, ciudad_label, ciudad_original, i)
 
+# Panel con tiempos de ejecución y métricas de la caché de figuras
+render_tiempos()
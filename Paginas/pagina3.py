@@ -1,8 +1,14 @@
+import os
 import streamlit as st
 import pandas as pd
+import numpy as np
 import plotly.express as px
-from utils.utils_datos import load_data
+from utils.utils_datos import barrios_geojson, load_data, ruta_barrios, version_datos
 from utils.utils_filtros import filtros_ciudad_barrios_precios
+from utils.utils_espacial import indices_espaciales, zoom_ajustado
+from utils.extraccion_mapas import figura_coropletas
+from utils.utils_estadisticas import preparar_puntos_dispersion
+from utils.utils_kpis import distribuciones_cacheadas, percentil_de
 
 
 # Título principal del módulo.
@@ -218,7 +224,12 @@ st.caption("Relación precio vs rating por barrio (listings filtrados)")
 
 if {"price", "review_scores_rating", "barrio_std"}.issubset(df_city.columns):
 
-    scatter_df = df_city.dropna(subset=["price", "review_scores_rating", "barrio_std"])
+    scatter_df = preparar_puntos_dispersion(
+        df_city.dropna(subset=["barrio_std"]),
+        "price",
+        "review_scores_rating",
+        ["barrio_std", "amenities_count"],
+    )
 
     if not scatter_df.empty:
         fig = px.scatter(
@@ -226,7 +237,8 @@ if {"price", "review_scores_rating", "barrio_std"}.issubset(df_city.columns):
             x="price",
             y="review_scores_rating",
             color="barrio_std",
-            size="amenities_count"
+            size="amenities_count",
+            render_mode="webgl"
         )
         fig = compact(fig)
         fig.update_xaxes(title="Precio (€)")
@@ -234,33 +246,56 @@ if {"price", "review_scores_rating", "barrio_std"}.issubset(df_city.columns):
         st.plotly_chart(fig, use_container_width=True)
 
 
+# Mapa de coropletas por barrio a partir de la tabla agregada (agr).
+# Usa la geometría local de barrios simplificada para el zoom del mapa;
+# el mapa pesa según el número de barrios y no según el número de listings.
+# La sección solo aparece si existe la geometría de la ciudad (data/barrios/<ciudad>.geojson).
+if ciudad_sel is not None and os.path.exists(ruta_barrios(ciudad_sel)):
+    st.markdown("### Mapa de barrios")
+
+    if not agr.empty and df_city["latitude"].notna().any():
+        metricas_mapa = {
+            "Precio medio (€)": "price_mean",
+            "Rating medio": "rating_mean",
+            "N.º de listings": "listings",
+        }
+        metrica_mapa = st.radio("Métrica", list(metricas_mapa), horizontal=True, key="metrica_mapa_barrios")
+
+        zoom_barrios = zoom_ajustado(df_city["latitude"], df_city["longitude"])
+        fig = figura_coropletas(
+            agr,
+            barrios_geojson(ciudad_sel, zoom_barrios),
+            metricas_mapa[metrica_mapa],
+            zoom=zoom_barrios,
+            center={"lat": df_city["latitude"].mean(), "lon": df_city["longitude"].mean()},
+            titulo_color=metrica_mapa,
+            color_continuous_scale=["#FFE3E6", "#FFB3BA", "#FF7A85", "#FF5A5F", "#FF385C"],
+        )
+        st.plotly_chart(fig, use_container_width=True)
+    else:
+        st.info("No hay datos de ubicación para los barrios seleccionados.")
+
+
 # Módulo de reputación
 # Clasificación usando reglas híbridas basadas en rating + número de reseñas acumuladas
 st.markdown("### Reputación en barrios seleccionados")
 
-if {"review_scores_rating", "number_of_reviews_ltm"}.issubset(df_city.columns):
-
-    rep_df = df_city.dropna(subset=["review_scores_rating", "number_of_reviews_ltm"]).copy()
-
-    if not rep_df.empty:
-
-        # Reglas:
-        # Top host → rating alto y volumen mínimo
-        cond_top = (rep_df["review_scores_rating"] >= 4.8) & (rep_df["number_of_reviews_ltm"] >= 30)
+if "categoria_reputacion" in df_city.columns:
 
-        # Riesgoso → rating bajo o sin historial de reseñas
-        cond_risk = (rep_df["review_scores_rating"] < 4.3) | (rep_df["number_of_reviews_ltm"] < 5)
-
-        rep_df["categoria_reputacion"] = "Normal"
-        rep_df.loc[cond_top, "categoria_reputacion"] = "Top host"
-        rep_df.loc[cond_risk, "categoria_reputacion"] = "Riesgoso"
+    # Categoría calculada en la ingesta (utils_datos.clasificar_reputacion):
+    # Top host → rating alto y volumen mínimo
+    # Riesgoso → rating bajo o sin historial de reseñas
+    if df_city["categoria_reputacion"].notna().any():
 
         c1, c2 = st.columns([1, 1])
 
         with c1:
+            # Conteos agrupados sobre la selección; se omiten las categorías sin listings
+            conteos = df_city["categoria_reputacion"].value_counts(sort=False)
+            conteos = conteos[conteos > 0]
             cat_counts = (
-                rep_df["categoria_reputacion"]
-                .value_counts(normalize=True)
+                conteos
+                .div(conteos.sum())
                 .mul(100)
                 .round(1)
                 .reset_index()
@@ -280,15 +315,22 @@ if {"review_scores_rating", "number_of_reviews_ltm"}.issubset(df_city.columns):
 
 
         with c2:
+            puntos_rep = preparar_puntos_dispersion(
+                df_city,
+                "number_of_reviews_ltm",
+                "review_scores_rating",
+                ["categoria_reputacion", "amenities_count"],
+            )
             fig = px.scatter(
-                rep_df,
+                puntos_rep,
                 x="number_of_reviews_ltm",
                 y="review_scores_rating",
                 color="categoria_reputacion",
                 size="amenities_count",
                 size_max=10,
                 color_discrete_sequence=rating,
-                height=350
+                height=350,
+                render_mode="webgl"
             )
             fig.update_xaxes(title="Número de reviews")
             fig.update_yaxes(title="Rating")
@@ -297,3 +339,90 @@ if {"review_scores_rating", "number_of_reviews_ltm"}.issubset(df_city.columns):
         st.info("No hay puntos suficientes para evaluación de reputación.")
 else:
     st.info("Faltan columnas para generar reputación.")
+
+
+# Búsqueda de listings cercanos a un punto usando el índice espacial por ciudad.
+# Se ejecuta como fragmento: mover el punto o el radio no recalcula el resto de la página.
+@st.fragment
+def render_cercanos(df, ciudad_sel, df_city):
+    st.markdown("### Listings cercanos a un punto")
+
+    indice = indices_espaciales(df, version_datos(df)).get(ciudad_sel)
+    if indice is None or len(indice) == 0:
+        st.info("No hay coordenadas disponibles para esta ciudad.")
+        return
+
+    # Punto inicial: centro de los listings filtrados (o de la ciudad si no hay)
+    ref = df_city if df_city["latitude"].notna().any() else df[df["ciudad"] == ciudad_sel]
+    c1, c2, c3, c4 = st.columns(4)
+    with c1:
+        lat = st.number_input("Latitud", value=float(ref["latitude"].median()), format="%.5f", key="cerca_lat")
+    with c2:
+        lon = st.number_input("Longitud", value=float(ref["longitude"].median()), format="%.5f", key="cerca_lon")
+    with c3:
+        radio = st.slider("Radio (km)", 0.1, 5.0, 1.0, 0.1, key="cerca_radio")
+    with c4:
+        k = st.slider("Más cercanos", 5, 50, 10, key="cerca_k")
+
+    pos_radio, _ = indice.en_radio(lat, lon, radio)
+    pos, dist = indice.vecinos(lat, lon, k)
+
+    st.metric(f"Listings a menos de {radio:.1f} km", f"{len(pos_radio):,}")
+
+    columnas = [c for c in ["barrio_std", "room_type", "price", "pctl_barrio_precio", "review_scores_rating"] if c in df.columns]
+    cercanos = df.loc[indice.etiquetas[pos], columnas].copy()
+    cercanos.insert(0, "distancia_km", dist.round(3))
+    st.dataframe(cercanos, use_container_width=True, hide_index=True)
+
+
+if {"latitude", "longitude"}.issubset(df.columns) and ciudad_sel is not None:
+    render_cercanos(df, ciudad_sel, df_city)
+
+
+# Posición de un valor cualquiera dentro de la ciudad y de los barrios elegidos.
+# Las consultas usan las distribuciones ordenadas cacheadas en la ingesta
+# (np.searchsorted), sin volver a recorrer los listings.
+METRICAS_POSICION = {
+    "Precio (€)": "price",
+    "Precio por persona (€)": "price_per_person",
+    "Rating": "review_scores_rating",
+    "Reseñas (12 meses)": "number_of_reviews_ltm",
+    "Amenidades": "amenities_count",
+}
+
+
+@st.fragment
+def render_posicion(df, ciudad_sel, barrios_sel):
+    st.markdown("### ¿Dónde se ubica un valor?")
+
+    distribuciones = distribuciones_cacheadas(df, version_datos(df))
+
+    c1, c2 = st.columns(2)
+    with c1:
+        etiqueta = st.selectbox("Métrica", list(METRICAS_POSICION), key="posicion_metrica")
+    metrica = METRICAS_POSICION[etiqueta]
+
+    orden_ciudad = distribuciones["ciudad"].get(metrica, {}).get(ciudad_sel)
+    if orden_ciudad is None or not len(orden_ciudad):
+        st.info("No hay datos de esta métrica para la ciudad.")
+        return
+
+    with c2:
+        valor = st.number_input("Valor", value=float(np.median(orden_ciudad)), key=f"posicion_valor_{metrica}")
+
+    st.metric(
+        f"Percentil en {ciudad_sel}",
+        f"{percentil_de(distribuciones, metrica, valor, ciudad_sel):.0f}",
+        help="% de listings de la ciudad con un valor menor o igual.",
+    )
+
+    if barrios_sel:
+        posiciones = pd.DataFrame({
+            "barrio": barrios_sel,
+            "percentil": [percentil_de(distribuciones, metrica, valor, ciudad_sel, b) for b in barrios_sel],
+        }).round(1)
+        st.dataframe(posiciones, use_container_width=True, hide_index=True)
+
+
+if ciudad_sel is not None:
+    render_posicion(df, ciudad_sel, barrios_sel)
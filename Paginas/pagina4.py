@@ -4,6 +4,7 @@ from utils.utils_datos import load_data
 from utils.utils_filtros import sidebar_filtros
 from utils.extraccion_ciudad import render_tab_ciudad
 from utils.extraccion_comparativo import render_tab_comparativo
+from utils.utils_rendimiento import medir, render_tiempos
 
 
 # Título principal de la página que indica la naturaleza del módulo
@@ -73,8 +74,10 @@ tab_ciudad, tab_comparativo = st.tabs(["Por ciudad", "Comparativo multi-ciudad"]
 
 
 # Renderizado de contenido específico para cada tab
-# El contenido se delega a funciones especializadas modularizadas
-with tab_ciudad:
+# El contenido se delega a funciones especializadas modularizadas.
+# Se mide el tiempo de cada pestaña para compararlo con los reruns parciales
+# de los fragmentos (boxplot, heatmap y ROI).
+with tab_ciudad, medir("Pestaña por ciudad"):
     render_tab_ciudad(
         df_filtered,
         selected_cities,
@@ -85,7 +88,7 @@ with tab_ciudad:
         PALETTE
     )
 
-with tab_comparativo:
+with tab_comparativo, medir("Pestaña comparativo"):
     render_tab_comparativo(
         df_filtered,
         selected_cities,
@@ -96,3 +99,5 @@ with tab_comparativo:
         AIRBNB_COMPETITIVENESS_SCALE
     )
 
+# Panel con los tiempos registrados durante la sesión
+render_tiempos()
@@ -0,0 +1,103 @@
+import numpy as np
+import pandas as pd
+
+from utils.extraccion_competitividad import (
+    calcular_competitividad,
+    calcular_competitividad_ciudades,
+    componer_competitividad,
+    parciales_competitividad,
+)
+
+
+METRICAS = ["prof", "flex", "amen", "precio", "index"]
+
+
+def _listings(n=3000, semilla=0):
+    rng = np.random.default_rng(semilla)
+    df = pd.DataFrame({
+        "ciudad": rng.choice(["Madrid", "Milan", "Atenas"], n),
+        "barrio_std": rng.choice(["B1", "B2", "B3", "B4"], n),
+        "room_type": rng.choice(["Entire home/apt", "Private room", None], n),
+        "es_superhost": rng.random(n) < 0.3,
+        "instant_bookable": rng.choice(["t", "f", None], n),
+        # Rangos que no saturan amen ni precio en 100, para comparar valores y no el tope
+        "amenities_count": rng.integers(0, 20, n).astype(float),
+        "price": rng.gamma(6, 25, n),
+    })
+    df.loc[rng.random(n) < 0.05, "price"] = np.nan
+    df.loc[rng.random(n) < 0.05, "amenities_count"] = np.nan
+    return df
+
+
+def _ciudades_con_bucle(df, ciudades):
+    """
+    Implementación original: filtra df por ciudad y llama a calcular_competitividad.
+    """
+    rows = []
+    for c in ciudades:
+        m = calcular_competitividad(df[df["ciudad"] == c])
+        m["Ciudad"] = c
+        rows.append(m)
+    return pd.DataFrame(rows)
+
+
+def test_ciudades_agrupado_coincide_con_bucle():
+    df = _listings()
+    # "Lisboa" no tiene filas: debe quedar en NaN igual que en el bucle
+    ciudades = ["Milan", "Lisboa", "Madrid", "Atenas"]
+
+    esperado = _ciudades_con_bucle(df, ciudades)
+    obtenido = calcular_competitividad_ciudades(df, ciudades)
+
+    pd.testing.assert_frame_equal(obtenido, esperado, rtol=1e-12)
+    assert obtenido.loc[obtenido["Ciudad"] == "Lisboa", METRICAS].isna().all(axis=None)
+
+
+def test_barrios_agrupado_coincide_con_bucle():
+    df = _listings()
+    obtenido = calcular_competitividad_ciudades(df, ["Madrid", "Milan"], por_barrio=True)
+
+    rows = []
+    for (c, b), g in df[df["ciudad"].isin(["Madrid", "Milan"])].groupby(["ciudad", "barrio_std"]):
+        m = calcular_competitividad(g)
+        m["Ciudad"], m["Barrio"] = c, b
+        rows.append(m)
+    esperado = pd.DataFrame(rows)
+
+    obtenido = obtenido.sort_values(["Ciudad", "Barrio"]).reset_index(drop=True)
+    pd.testing.assert_frame_equal(obtenido, esperado, rtol=1e-12)
+
+
+def test_parciales_compuestos_coinciden_con_una_ciudad():
+    df = _listings()
+    parciales = parciales_competitividad(df)
+
+    for ciudad in ["Madrid", "Milan", "Atenas"]:
+        de_ciudad = df["ciudad"] == ciudad
+        compuesto = componer_competitividad(parciales, mascara=parciales["ciudad"] == ciudad).iloc[0]
+        directo = calcular_competitividad(df[de_ciudad])
+
+        assert compuesto["n"] == de_ciudad.sum()
+        np.testing.assert_allclose(
+            compuesto[METRICAS].to_numpy(dtype=float),
+            [directo[m] for m in METRICAS],
+            rtol=1e-14,
+        )
+
+
+def test_parciales_compuestos_por_tipo_y_barrio():
+    df = _listings()
+    parciales = parciales_competitividad(df)
+
+    # Selección de un solo tipo de alojamiento (filas con room_type nulo excluidas)
+    mascara = (parciales["ciudad"] == "Madrid") & (parciales["room_type"] == "Private room")
+    por_barrio = componer_competitividad(parciales, ["barrio_std"], mascara)
+
+    seleccion = df[(df["ciudad"] == "Madrid") & (df["room_type"] == "Private room")]
+    for barrio, g in seleccion.groupby("barrio_std"):
+        directo = calcular_competitividad(g)
+        np.testing.assert_allclose(
+            por_barrio.loc[barrio, METRICAS].to_numpy(dtype=float),
+            [directo[m] for m in METRICAS],
+            rtol=1e-14,
+        )
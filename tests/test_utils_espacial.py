@@ -0,0 +1,38 @@
+import numpy as np
+
+from utils.utils_espacial import IndiceEspacial, haversine_km
+
+
+def _indice_barcelona(n=2000, semilla=0):
+    rng = np.random.default_rng(semilla)
+    lat = 41.38 + rng.normal(0, 0.02, n)
+    lon = 2.17 + rng.normal(0, 0.03, n)
+    return IndiceEspacial(lat, lon), lat, lon
+
+
+def _vecinos_fuerza_bruta(lat, lon, lat0, lon0, k):
+    dist = haversine_km(lat0, lon0, lat, lon)
+    orden = np.argsort(dist, kind="stable")[:k]
+    return orden, dist[orden]
+
+
+def test_vecinos_dentro_de_la_ciudad():
+    indice, lat, lon = _indice_barcelona()
+    pos, dist = indice.vecinos(41.385, 2.175, k=10)
+    esperado, dist_esperada = _vecinos_fuerza_bruta(lat, lon, 41.385, 2.175, 10)
+
+    assert len(pos) == 10
+    np.testing.assert_allclose(dist, dist_esperada)
+    assert set(pos) == set(esperado)
+
+
+def test_vecinos_consulta_fuera_de_la_rejilla():
+    indice, lat, lon = _indice_barcelona()
+
+    for lat0, lon0 in [(42.5, 3.0), (40.0, 0.0)]:
+        pos, dist = indice.vecinos(lat0, lon0, k=10)
+        esperado, dist_esperada = _vecinos_fuerza_bruta(lat, lon, lat0, lon0, 10)
+
+        assert len(pos) == 10
+        np.testing.assert_allclose(dist, dist_esperada)
+        assert set(pos) == set(esperado)
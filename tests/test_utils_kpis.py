@@ -0,0 +1,102 @@
+import numpy as np
+import pandas as pd
+
+from utils.utils_kpis import (
+    METRICAS_MEDIA,
+    METRICAS_PERCENTIL,
+    NIVELES,
+    agregar_percentiles,
+    calcular_kpis,
+    construir_distribuciones,
+    percentil_de,
+)
+
+
+def _listings(n=400, semilla=0):
+    rng = np.random.default_rng(semilla)
+    df = pd.DataFrame({
+        "ciudad": rng.choice(["Madrid", "Milan"], n),
+        "barrio_std": rng.choice(["B1", "B2", "B3", None], n),
+        "room_type": rng.choice(["Entire home/apt", "Private room", None], n),
+        "accommodates": rng.integers(1, 5, n),
+        "price": rng.uniform(30, 300, n),
+        "review_scores_rating": rng.uniform(3, 5, n),
+        "price_per_person": rng.uniform(10, 100, n),
+        "number_of_reviews_ltm": rng.poisson(10, n).astype(float),
+        "amenities_count": rng.integers(0, 40, n).astype(float),
+        "es_superhost": rng.random(n) < 0.3,
+    })
+    # Métricas con nulos: el promedio debe ignorarlos, como en pandas
+    df.loc[rng.random(n) < 0.1, "price"] = np.nan
+    df.loc[rng.random(n) < 0.1, "review_scores_rating"] = np.nan
+    return df
+
+
+def _esperado(df, columnas):
+    """
+    Mismo resumen que el motor, calculado con groupby().mean() sobre los listings.
+    """
+    presentes = {col: nombre for col, nombre in METRICAS_MEDIA.items() if col in df.columns}
+    agregaciones = {"listings": ("es_superhost", "size")}
+    agregaciones.update({nombre: (col, "mean") for col, nombre in presentes.items()})
+    agregaciones["pct_superhost"] = ("es_superhost", "mean")
+
+    if columnas:
+        res = df.groupby(columnas, dropna=True).agg(**agregaciones).reset_index()
+    else:
+        res = df.assign(_todo=0).groupby("_todo").agg(**agregaciones).reset_index(drop=True)
+    res["pct_superhost"] *= 100
+    return res, list(presentes.values())
+
+
+def test_niveles_coinciden_con_groupby_con_claves_nulas():
+    df = _listings()
+    kpis = calcular_kpis(df)
+
+    for nivel in ["global", "ciudad", "ciudad_barrio", "ciudad_room_type", "capacidad", "room_type"]:
+        columnas = NIVELES[nivel]
+        esperado, metricas = _esperado(df, columnas)
+        obtenido = kpis[nivel][columnas + ["listings"] + metricas + ["pct_superhost"]]
+
+        if columnas:
+            esperado = esperado.sort_values(columnas).reset_index(drop=True)
+            obtenido = obtenido.sort_values(columnas).reset_index(drop=True)
+
+        pd.testing.assert_frame_equal(obtenido, esperado, check_dtype=False, rtol=1e-12)
+
+
+def test_conteos_por_nivel_con_claves_nulas():
+    df = _listings()
+    kpis = calcular_kpis(df)
+
+    # El nivel global cuenta todos los listings; los niveles con clave descartan los nulos
+    assert kpis["global"]["listings"].iloc[0] == len(df)
+
+    por_tipo = kpis["room_type"].set_index("room_type")["listings"].sort_index()
+    esperado = df["room_type"].value_counts().sort_index()
+    assert por_tipo.to_dict() == esperado.to_dict()
+
+    por_barrio = kpis["ciudad_barrio"]["listings"].sum()
+    assert por_barrio == df["barrio_std"].notna().sum()
+
+
+def test_percentil_de_coincide_con_rangos_de_ingesta():
+    df = _listings(n=2000)
+    # Precios redondeados para que también haya empates en price
+    df["price"] = df["price"].round(-1)
+    con_pctl = agregar_percentiles(df)
+    distribuciones = construir_distribuciones(df)
+
+    # Muestra de filas de cada ciudad y de cada barrio (incluye barrio nulo)
+    muestra = con_pctl.groupby(["ciudad", "barrio_std"], dropna=False).sample(15, random_state=0)
+
+    for _, fila in muestra.iterrows():
+        for col, sufijo in METRICAS_PERCENTIL.items():
+            por_ciudad = percentil_de(distribuciones, col, fila[col], fila["ciudad"])
+            np.testing.assert_allclose(por_ciudad, fila[f"pctl_ciudad_{sufijo}"], atol=1e-4)
+
+            if pd.isna(fila["barrio_std"]):
+                assert np.isnan(fila[f"pctl_barrio_{sufijo}"])
+                continue
+            por_barrio = percentil_de(distribuciones, col, fila[col], fila["ciudad"], fila["barrio_std"])
+            np.testing.assert_allclose(por_barrio, fila[f"pctl_barrio_{sufijo}"], atol=1e-4)
@@ -2,11 +2,13 @@ import streamlit as st
 import pandas as pd
 import numpy as np
 import plotly.express as px
+import plotly.graph_objects as go
 
 # Estas funciones encapsulan cálculos y visualizaciones avanzadas
 # relacionadas al profesionalismo, competitividad y estructura de la ciudad.
 from utils.extraccion_competitividad import (
-    calcular_competitividad,
+    componer_competitividad,
+    parciales_cacheados,
     render_radar_competitividad,
     render_vecindarios_profesionalismo,
 )
@@ -14,6 +16,11 @@ from utils.extraccion_competitividad import (
 # Función que permite presentar distribuciones geográficas sobre el mapa
 from utils.extraccion_mapas import render_mapa_ciudad
 
+from utils.utils_datos import filtrar_con_version, version_datos
+from utils.utils_rendimiento import medir
+from utils.utils_kpis import MIN_SOPORTE
+from utils.utils_estadisticas import coocurrencias_cacheadas, coocurrencias_de, resumen_cajas
+
 # Paleta aplicada en gráficas de identificación visual asociadas a la marca Airbnb
 AIRBNB_COLORS = [
     "#FFF5F5",
@@ -48,8 +55,9 @@ def render_tab_ciudad(
     # Selección controlada de una sola ciudad a analizar en detalle
     ciudad_sel = st.selectbox("Ciudad para gráficas individuales", selected_cities)
 
-    # Subconjunto con solo la ciudad elegida para evitar ruido visual
-    df_city = df_filtered[df_filtered["ciudad"] == ciudad_sel].copy()
+    # Subconjunto con solo la ciudad elegida para evitar ruido visual.
+    # Se marca con su propia versión para que los cálculos cacheados no se mezclen entre ciudades.
+    df_city = filtrar_con_version(df_filtered, df_filtered["ciudad"] == ciudad_sel, ciudad_sel)
 
     st.markdown("## Análisis detallado por ciudad")
 
@@ -90,6 +98,121 @@ def render_tab_ciudad(
 
 
     with col2:
+        # El boxplot se ejecuta como fragmento: cambiar su selector solo
+        # vuelve a ejecutar esta sección y no el resto de la página.
+        _render_boxplot(df_city, Lista, top_k, PALETTE)
+
+    st.markdown("---")
+
+
+    # SEGUNDO BLOQUE VISUAL: Coocurrencias de categorías + profesionalismo de host
+    col3, col4 = st.columns(2)
+
+    with col3:
+        # Fragmento independiente: los selectores de ejes no recalculan radar ni mapa.
+        _render_heatmap(df_city, Lista, PALETTE)
+
+
+    with col4:
+        st.subheader("Profesionalismo por vecindario")
+
+        # Esta función mide qué porcentaje del inventario es gestionado por Superhosts
+        # Lo cual sirve como indicador de madurez del mercado en cada barrio
+        render_vecindarios_profesionalismo(df_city)
+
+    st.markdown("---")
+
+
+    # TERCER BLOQUE VISUAL: Índice competitivo + Geolocalización
+    col_radar, col_mapa = st.columns(2)
+
+    with col_radar:
+        st.subheader("Índice de Competitividad")
+
+        # Radar de la ciudad y ranking de barrios compuestos a partir de
+        # agregados parciales cacheados; cambiar la selección no recorre listings.
+        _render_competitividad(df_filtered, ciudad_sel, top_k, PALETTE)
+
+
+    with col_mapa:
+        st.subheader("Mapa Geoespacial")
+
+        # Mapa con puntos georreferenciados de Airbnb visibles según ciudad
+        # Permite ver concentración de inventario (centro, playa, periferias)
+        render_mapa_ciudad(df_city)
+
+
+
+@st.fragment
+def _render_competitividad(df_filtered, ciudad_sel, top_k, PALETTE):
+    """
+    Radar de competitividad de la ciudad y ranking de barrios, compuestos a
+    partir de agregados parciales cacheados. Al ser un fragmento, cambiar
+    los tipos de alojamiento solo vuelve a ejecutar esta función.
+    """
+    with medir("Competitividad (fragmento)"):
+        parciales = parciales_cacheados(df_filtered, version_datos(df_filtered))
+        de_ciudad = parciales["ciudad"] == ciudad_sel
+
+        tipos = sorted(parciales.loc[de_ciudad, "room_type"].dropna().unique())
+        tipos_sel = st.multiselect("Tipos de alojamiento", tipos, default=tipos, key="comp_room_types")
+
+        # Con todos los tipos seleccionados no se filtra: así se incluyen los
+        # listings sin room_type y el radar coincide con el de toda la ciudad
+        if set(tipos_sel) == set(tipos):
+            seleccion = de_ciudad
+        else:
+            seleccion = de_ciudad & parciales["room_type"].isin(tipos_sel)
+
+        if not seleccion.any():
+            st.info("No hay listings para la selección.")
+            return
+
+        # Se calcula una métrica global ponderada con varios factores
+        comp = componer_competitividad(parciales, mascara=seleccion).iloc[0].to_dict()
+
+        # Radar permite comparar simultáneamente las dimensiones competitivas
+        render_radar_competitividad(comp, ciudad_sel, PALETTE)
+
+        # Ranking de barrios con soporte suficiente según el mismo índice
+        barrios = componer_competitividad(parciales, ["barrio_std"], seleccion).reset_index()
+        barrios = barrios[barrios["n"] >= MIN_SOPORTE].nlargest(top_k, "index")
+
+        if not barrios.empty:
+            st.markdown("##### Barrios más competitivos")
+            fig = px.bar(
+                barrios.sort_values("index"),
+                x="index",
+                y="barrio_std",
+                orientation="h",
+                hover_data={"n": True, "prof": ":.1f", "amen": ":.1f", "precio": ":.1f"},
+                color_discrete_sequence=[PALETTE["brand"]],
+            )
+            fig.update_layout(height=380, margin=dict(l=10, r=10, t=10, b=10))
+            fig.update_xaxes(title="Índice de competitividad", range=[0, 100])
+            fig.update_yaxes(title=None)
+            st.plotly_chart(fig, use_container_width=True)
+
+
+@st.cache_data(show_spinner=False)
+def _datos_boxplot(_df_city, version, cat_box, top_n):
+    """
+    Resume el precio de las categorías más frecuentes para el boxplot:
+    cuartiles, bigotes y una muestra acotada de atípicos por categoría.
+
+    El DataFrame no se hashea (prefijo "_"); la llave de caché es la versión
+    del subconjunto junto con la categoría y el número de categorías.
+    """
+    return resumen_cajas(_df_city, cat_box, "price", top_n)
+
+
+@st.fragment
+def _render_boxplot(df_city, Lista, top_k, PALETTE):
+    """
+    Boxplot de precio por categoría. Al ser un fragmento, una interacción
+    con su selector solo vuelve a ejecutar esta función.
+    """
+    with medir("Boxplot (fragmento)"):
         st.subheader("Boxplot — Precio por categoría")
 
         # Para generar análisis de variabilidad, debe existir una columna válida de price
@@ -102,40 +225,48 @@ def render_tab_ciudad(
                 key="boxcat_ciudad",
             )
 
-            df_box = df_city[[cat_box, "price"]].dropna()
-
-            # Se reducen categorías a las más frecuentes para evitar esquemas saturados visualmente
-            top_cats = (
-                df_box[cat_box]
-                .astype(str)
-                .value_counts()
-                .head(min(top_k, 15))
-                .index
-            )
-
-            df_box = df_box[df_box[cat_box].astype(str).isin(top_cats)]
-
-            # Boxplot permite observar mediana, dispersión e outliers
-            fig_box = px.box(
-                df_box,
-                x=cat_box,
-                y="price",
-                color=cat_box,
-                color_discrete_sequence=[PALETTE["brand"], PALETTE["accent"]],
-                points=False,
-            )
-            fig_box.update_layout(height=380)
+            resumen, atipicos = _datos_boxplot(df_city, version_datos(df_city), cat_box, min(top_k, 15))
+
+            # Boxplot permite observar mediana, dispersión e outliers.
+            # Las cajas se dibujan con estadísticos ya calculados: el navegador
+            # recibe unas cifras por categoría en lugar de todos los precios.
+            colores = [PALETTE["brand"], PALETTE["accent"]]
+            fig_box = go.Figure()
+            for i, fila in enumerate(resumen.itertuples(index=False)):
+                fig_box.add_trace(go.Box(
+                    x=[fila.categoria],
+                    q1=[fila.q1],
+                    median=[fila.mediana],
+                    q3=[fila.q3],
+                    lowerfence=[fila.bigote_inf],
+                    upperfence=[fila.bigote_sup],
+                    name=fila.categoria,
+                    marker_color=colores[i % len(colores)],
+                ))
+
+            if not atipicos.empty:
+                fig_box.add_trace(go.Scatter(
+                    x=atipicos["categoria"],
+                    y=atipicos["valor"],
+                    mode="markers",
+                    marker=dict(size=4, color=PALETTE["accent"], opacity=0.5),
+                    name="Atípicos (muestra)",
+                    hovertemplate="%{x}<br>price: %{y}<extra></extra>",
+                ))
+
+            fig_box.update_layout(height=380, xaxis_title=cat_box, yaxis_title="price")
             st.plotly_chart(fig_box, use_container_width=True)
         else:
             st.info("No existe columna 'price' válida para boxplot.")
 
-    st.markdown("---")
-
-
-    # SEGUNDO BLOQUE VISUAL: Coocurrencias de categorías + profesionalismo de host
-    col3, col4 = st.columns(2)
 
-    with col3:
+@st.fragment
+def _render_heatmap(df_city, Lista, PALETTE):
+    """
+    Heatmap de coocurrencias entre dos variables categóricas,
+    ejecutado como fragmento independiente del resto de la pestaña.
+    """
+    with medir("Heatmap (fragmento)"):
         st.subheader("Heatmap de coocurrencias")
 
         # Extraemos solo variables categóricas disponibles
@@ -151,16 +282,16 @@ def render_tab_ciudad(
                 key="heat_y_ciudad",
             )
 
-            # Se genera tabla de conteos
-            df_hm = df_city[[cat_x, cat_y]].astype(str)
-            t = df_hm.value_counts().reset_index(name="freq")
+            # Tablas de todos los pares precalculadas por ciudad (cacheadas);
+            # cambiar de ejes solo selecciona la tabla correspondiente
+            tablas = coocurrencias_cacheadas(df_city, version_datos(df_city), tuple(cats_heat))
+            t = coocurrencias_de(tablas, cat_x, cat_y)
 
             # Heatmap para observar coincidencias entre categorías
-            fig_hm = px.density_heatmap(
+            fig_hm = px.imshow(
                 t,
-                x=cat_x,
-                y=cat_y,
-                z="freq",
+                aspect="auto",
+                labels=dict(x=cat_x, y=cat_y, color="freq"),
                 color_continuous_scale=["#E0F7FA", PALETTE["accent"], "#004D40"],
                 height=390
             )
@@ -169,36 +300,3 @@ def render_tab_ciudad(
 
         else:
             st.info("Se requieren al menos 2 variables categóricas para el heatmap.")
-
-
-    with col4:
-        st.subheader("Profesionalismo por vecindario")
-
-        # Esta función mide qué porcentaje del inventario es gestionado por Superhosts
-        # Lo cual sirve como indicador de madurez del mercado en cada barrio
-        render_vecindarios_profesionalismo(df_city)
-
-    st.markdown("---")
-
-
-    # TERCER BLOQUE VISUAL: Índice competitivo + Geolocalización
-    col_radar, col_mapa = st.columns(2)
-
-    with col_radar:
-        st.subheader("Índice de Competitividad")
-
-        # Se calcula una métrica global ponderada con varios factores
-        comp = calcular_competitividad(df_city)
-
-        # Radar permite comparar simultáneamente las dimensiones competitivas
-        render_radar_competitividad(comp, ciudad_sel, PALETTE)
-
-
-    with col_mapa:
-        st.subheader("Mapa Geoespacial")
-
-        # Mapa con puntos georreferenciados de Airbnb visibles según ciudad
-        # Permite ver concentración de inventario (centro, playa, periferias)
-        render_mapa_ciudad(df_city)
-
-
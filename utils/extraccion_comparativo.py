@@ -11,6 +11,21 @@ from utils.extraccion_competitividad import (
 )
 
 from utils.extraccion_mapas import render_mapa_comparativo
+from utils.extraccion_roi import (
+    COMISION_AIRBNB,
+    COMISION_GRID,
+    COSTOS_LIMPIEZA,
+    SIMULACIONES_ROI,
+    cubo_roi,
+    html_ranking_roi,
+    ocupaciones_ciudades,
+    render_sensibilidad_roi,
+    simular_roi_cacheado,
+    supuestos_ciudades,
+)
+from utils.utils_datos import version_datos
+from utils.utils_kpis import kpis_cacheados, kpis_ciudad, ocupacion_revenue_cacheada
+from utils.utils_rendimiento import medir
 
 
 def render_tab_comparativo(
@@ -43,6 +58,13 @@ def render_tab_comparativo(
 
     st.subheader("KPIs por ciudad")
 
+    # Listings y precio promedio por ciudad salen del motor de KPIs (una sola pasada, cacheada);
+    # ocupación y revenue, de las estimaciones por listing agregadas una vez por versión de datos
+    kpis = kpis_cacheados(df_comp, version_datos(df_comp))
+    ocup_rev = ocupacion_revenue_cacheada(df_comp, version_datos(df_comp))["ciudad"]
+    ocupaciones = ocupaciones_ciudades(ocup_rev)
+    revenues = ocup_rev.set_index("ciudad")["revenue_media"].dropna() if not ocup_rev.empty else pd.Series(dtype=float)
+
     # Crear una pestaña específica para cada ciudad permite navegar por resultados
     # sin mezclar datos visualmente.
     tabs = st.tabs(selected_cities)
@@ -50,41 +72,38 @@ def render_tab_comparativo(
     for i, ciudad in enumerate(selected_cities):
         # Cada pestaña presentará KPIs de forma independiente
         with tabs[i]:
-            df_city = df_comp[df_comp["ciudad"] == ciudad]
+            kpi_city = kpis_ciudad(kpis, "ciudad", ciudad)
 
             colA, colB, colC, colD = st.columns(4)
 
             # Total de propiedades activas para la ciudad
             with colA:
-                st.metric("Listings", len(df_city))
+                st.metric("Listings", int(kpi_city["listings"].sum()))
 
             # Precio promedio de una noche
-            if "price" in df_city.columns:
-                precio_promedio = df_city["price"].mean()
+            if "price" in df_comp.columns and not kpi_city.empty:
+                precio_promedio = kpi_city["price_mean"].iloc[0]
             else:
                 precio_promedio = 0
 
             with colB:
                 st.metric("Precio promedio", f"€{precio_promedio:,.0f}")
 
-            # Se definen tasas aproximadas de ocupación por ciudad.
-            # Estos valores son referenciales basados en reportes del mercado europeo.
-            ocupacion_rates = {
-                "Barcelona": 0.68,
-                "Amsterdam": 0.62,
-                "Milan": 0.65,
-                "Athens": 0.70,
-                "Atenas": 0.70,
-                "Madrid": 0.67,
-            }
-            ocupacion = ocupacion_rates.get(ciudad, 0.65)
+            # Ocupación media estimada de los listings de la ciudad; si el dataset
+            # no la trae se usa la tasa de referencia del mercado (OCUPACION_REFERENCIA).
+            ocupacion = supuestos_ciudades([ciudad], {}, ocupaciones)[1][0]
 
             with colC:
                 st.metric("Ocupación Estimada", f"{ocupacion*100:.0f}%")
 
-            # Revenue aproximado anual se calcula a partir de ingresos promedio diarios
-            # multiplicado por días ocupados en el año.
-            revenue_neto_estimado = precio_promedio * (ocupacion * 365)
+            # Revenue neto anual: media del revenue estimado por listing (bruto,
+            # calculado sobre el precio publicado) menos comisión y limpieza, igual
+            # que el ROI. Si no existe, precio promedio (ya neto, ×0.80 en la
+            # ingesta) multiplicado por días ocupados en el año.
+            if ciudad in revenues.index:
+                revenue_neto_estimado = revenues[ciudad] * (1 - COMISION_AIRBNB - COSTOS_LIMPIEZA)
+            else:
+                revenue_neto_estimado = precio_promedio * (ocupacion * 365)
 
             with colD:
                 st.metric("Revenue Neto/Año", f"€{revenue_neto_estimado:,.0f}")
@@ -141,144 +160,112 @@ def render_tab_comparativo(
 
     st.markdown("<br><br>", unsafe_allow_html=True)
 
-    st.markdown(
-        "<h3 style='text-align: center;'>Comparativo Multi-Ciudad ROI</h3>",
-        unsafe_allow_html=True
-    )
-
-    # Entrada de usuario sobre costo operativo estimado
-    col_empty1, col_input, col_empty2 = st.columns([1, 2, 1])
-    with col_input:
-        gastos_mensuales_input_comp = st.number_input(
-            "Gastos operativos mensuales (€)",
-            min_value=200,
-            max_value=3000,
-            value=800,
-            step=50,
-            key="gastos_comp_multi",
-            help="Incluye mantenimiento, servicios e impuestos básicos."
-        )
-
-    st.markdown("<br>", unsafe_allow_html=True)
-
-    # Validación de al menos una ciudad seleccionada
-    if len(selected_cities) == 0:
-        st.warning("Selecciona al menos una ciudad para calcular ROI.")
-        return
+    # La sección ROI es un fragmento: modificar los gastos operativos
+    # solo vuelve a ejecutar el cálculo y el ranking, no los KPIs ni la competitividad.
+    _render_roi(df_comp, selected_cities)
 
-    st.markdown(
-        "<h4 style='text-align: center;'>Ranking ROI por Ciudad</h4>",
-        unsafe_allow_html=True
-    )
 
-    # Lista donde se almacenarán métricas comparativas por ciudad
-    roi_ciudades_comp = []
-
-    for ciudad in selected_cities:
-        ciudad_data = df_comp[df_comp["ciudad"] == ciudad].copy()
+@st.fragment
+def _render_roi(df_comp, selected_cities):
+    """
+    Renderiza el comparativo de ROI entre ciudades a partir del gasto
+    operativo mensual indicado por el usuario.
+    """
+    with medir("ROI (fragmento)"):
+        st.markdown(
+            "<h3 style='text-align: center;'>Comparativo Multi-Ciudad ROI</h3>",
+            unsafe_allow_html=True
+        )
 
-        # Estimación de ingresos basada en precio promedio limpio
-        if "price" in ciudad_data.columns:
-            ciudad_data["price_clean"] = (
-                ciudad_data["price"]
-                .astype(str)
-                .str.replace("$", "")
-                .str.replace(",", "")
-            )
-            ciudad_data["price_clean"] = pd.to_numeric(
-                ciudad_data["price_clean"], errors="coerce"
+        # Entrada de usuario sobre costo operativo estimado
+        col_empty1, col_input, col_empty2 = st.columns([1, 2, 1])
+        with col_input:
+            gastos_mensuales_input_comp = st.number_input(
+                "Gastos operativos mensuales (€)",
+                min_value=200,
+                max_value=3000,
+                value=800,
+                step=50,
+                key="gastos_comp_multi",
+                help="Incluye mantenimiento, servicios e impuestos básicos."
             )
-            precio_promedio_ciudad = ciudad_data["price_clean"].mean()
-        else:
-            precio_promedio_ciudad = 0
-
-        # Tasas aproximadas de ocupación para estimaciones de mercado
-        ocupacion_rates = {
-            "Barcelona": 0.68,
-            "Amsterdam": 0.62,
-            "Milan": 0.65,
-            "Athens": 0.70,
-            "Atenas": 0.70,
-            "Madrid": 0.67,
-        }
 
-        ocupacion_pct_ciudad = ocupacion_rates.get(ciudad, 0.65) * 100
-        dias_ocupados_ciudad = (ocupacion_pct_ciudad / 100) * 365
+        st.markdown("<br>", unsafe_allow_html=True)
 
-        revenue_bruto_ciudad = precio_promedio_ciudad * dias_ocupados_ciudad
+        # Validación de al menos una ciudad seleccionada
+        if len(selected_cities) == 0:
+            st.warning("Selecciona al menos una ciudad para calcular ROI.")
+            return
 
-        # Descuentos estimados por comisiones
-        comision_airbnb = revenue_bruto_ciudad * 0.15
-        costos_limpieza = revenue_bruto_ciudad * 0.05
-
-        revenue_neto_ciudad = revenue_bruto_ciudad - comision_airbnb - costos_limpieza
-
-        # Costos operativos fijos ingresados por usuario
-        gastos_operativos_ciudad = gastos_mensuales_input_comp * 12
-
-        # Utilidad neta anual resultante
-        ganancia_neta_ciudad = revenue_neto_ciudad - gastos_operativos_ciudad
-
-        # Costos iniciales estimados por ciudad (setting cost)
-        setup_costs = {
-            "Barcelona": 8000,
-            "Amsterdam": 12000,
-            "Milan": 7000,
-            "Athens": 5000,
-            "Atenas": 5000,
-            "Madrid": 6500,
-        }
-        inversion_inicial = setup_costs.get(ciudad, 7000) + (gastos_mensuales_input_comp * 8)
-
-        # Indicador comparativo de rendimiento
-        # ROI = utilidad / inversión inicial
-        if inversion_inicial > 0:
-            roi_ciudad = ganancia_neta_ciudad / inversion_inicial * 100
-        else:
-            roi_ciudad = 0
-
-        roi_ciudades_comp.append(
-            {
-                "Ciudad": ciudad,
-                "Precio_Promedio": precio_promedio_ciudad,
-                "Ocupacion_Pct": ocupacion_pct_ciudad,
-                "Dias_Ocupados": dias_ocupados_ciudad,
-                "Revenue_Bruto": revenue_bruto_ciudad,
-                "Revenue_Neto": revenue_neto_ciudad,
-                "Inversion_Inicial": inversion_inicial,
-                "Ganancia_Neta": ganancia_neta_ciudad,
-                "ROI": roi_ciudad,
-            }
+        st.markdown(
+            "<h4 style='text-align: center;'>Ranking ROI por Ciudad</h4>",
+            unsafe_allow_html=True
         )
 
-    # Orden descendente de mayor a menor desempeño financiero
-    roi_ciudades_comp.sort(key=lambda x: x["ROI"], reverse=True)
-
-
-
+        # Precio promedio por ciudad del motor de KPIs cacheado (no depende de los gastos)
+        kpis = kpis_cacheados(df_comp, version_datos(df_comp))
+        precios_promedio = (
+            kpis["ciudad"].set_index("ciudad")["price_mean"]
+            if "price" in df_comp.columns
+            else pd.Series(dtype=float)
+        )
 
-    # Despliegue por ciudad con layout alineado a la izquierda y ancho completo
+        # Ranking ordenado de mayor a menor ROI. Los escenarios de todos los
+        # gastos de la rejilla se calculan de una vez y quedan en caché:
+        # cambiar el gasto solo lee una columna del resultado.
+        # La ocupación de cada ciudad sale de los datos (con la referencia como respaldo).
+        ocupaciones = ocupaciones_ciudades(
+            ocupacion_revenue_cacheada(df_comp, version_datos(df_comp))["ciudad"]
+        )
 
+        # Ranking ordenado de mayor a menor ROI, renderizado como un único bloque
+        # HTML cacheado por escenario (ciudades, precios, ocupaciones y gastos):
+        # el número de mensajes al navegador no depende del número de ciudades.
+        st.markdown(
+            html_ranking_roi(
+                tuple(selected_cities),
+                tuple(precios_promedio.items()),
+                tuple(ocupaciones.items()),
+                gastos_mensuales_input_comp,
+            ),
+            unsafe_allow_html=True,
+        )
 
-    st.markdown("<div style='max-width:900px;margin:0 auto;'>", unsafe_allow_html=True)
-    for rank, ciudad_roi in enumerate(roi_ciudades_comp):
-        st.markdown("<div style='display:flex;align-items:flex-start;justify-content:center;margin-bottom:8px;width:100%;'>", unsafe_allow_html=True)
-        # Centro: ranking, nombre y ROI badge
-        st.markdown(f"<div style='min-width:220px;text-align:center;'>"
-                    f"<div style='font-size:1.35rem;font-weight:700;margin-bottom:2px;'>#{rank+1}: {ciudad_roi['Ciudad']}</div>"
-                    f"<span style='background:#e3f0ff;color:#1976d2;padding:6px 22px;border-radius:8px;font-weight:600;display:inline-block;margin-top:8px;font-size:1.08rem;'>ROI: {ciudad_roi['ROI']:.1f}%</span>"
-                    f"</div>", unsafe_allow_html=True)
-        # Métricas centradas
-        st.markdown(f"<div style='display:flex;gap:64px;justify-content:center;margin-left:32px;'>"
-                    f"<div style='text-align:center;'><div style='font-size:1.12rem;color:#888;margin-bottom:2px;'>Ganancia Neta/Año</div><div style='font-size:1.7rem;font-weight:700;'>€{ciudad_roi['Ganancia_Neta']:,.0f}</div></div>"
-                    f"<div style='text-align:center;'><div style='font-size:1.12rem;color:#888;margin-bottom:2px;'>Revenue Neto</div><div style='font-size:1.7rem;font-weight:700;'>€{ciudad_roi['Revenue_Neto']:,.0f}</div></div>"
-                    f"</div>", unsafe_allow_html=True)
-        st.markdown("</div>", unsafe_allow_html=True)
-        # Detalles debajo, centrados
-        st.markdown(f"<div style='color:#888;font-size:0.99rem;margin:6px 0 0 0;text-align:center;'>"
-                    f"Precio promedio: €{ciudad_roi['Precio_Promedio']:.0f}/noche | Ocupación: {ciudad_roi['Ocupacion_Pct']:.0f}% ({ciudad_roi['Dias_Ocupados']:.0f} días/año)"
-                    f"</div>", unsafe_allow_html=True)
-        # Separador horizontal
-        st.markdown("<hr style='margin:18px 0 22px 0;border:0;border-top:1px solid #eee;'>", unsafe_allow_html=True)
-    st.markdown("</div>", unsafe_allow_html=True)
+        # Sensibilidad: ROI por gastos y ocupación leído del cubo de escenarios
+        with st.expander("Sensibilidad del ROI (gastos × ocupación × comisión)"):
+            ciudades = tuple(selected_cities)
+            precio, _, setup = supuestos_ciudades(ciudades, precios_promedio)
+            cubo = cubo_roi(ciudades, tuple(precio), tuple(setup))
+
+            col_c, col_k = st.columns(2)
+            with col_c:
+                ciudad_sens = st.selectbox("Ciudad", ciudades, key="roi_sens_ciudad")
+            with col_k:
+                comision_sens = st.select_slider(
+                    "Comisión de la plataforma",
+                    options=list(COMISION_GRID),
+                    value=COMISION_AIRBNB,
+                    format_func=lambda x: f"{x:.0%}",
+                    key="roi_sens_comision",
+                )
+            render_sensibilidad_roi(cubo, ciudad_sens, comision_sens, gastos_mensuales_input_comp)
+
+        # Incertidumbre: distribución del ROI por ciudad con simulación Monte Carlo
+        with st.expander("Simulación Monte Carlo del ROI"):
+            if "price" not in df_comp.columns:
+                st.info("No hay precios para simular el ROI.")
+            else:
+                sim = simular_roi_cacheado(
+                    df_comp, version_datos(df_comp), tuple(selected_cities), gastos_mensuales_input_comp
+                )
+                st.caption(
+                    f"{SIMULACIONES_ROI:,} simulaciones por ciudad: precio remuestreado de los listings, "
+                    "ocupación, gastos y setup con variación normal alrededor de sus valores de referencia."
+                )
+                st.dataframe(
+                    sim.sort_values("p50", ascending=False).rename(columns={"media": "ROI medio", "prob_perdida": "P(pérdida) %"})
+                    .round(1),
+                    use_container_width=True,
+                    hide_index=True,
+                )
 
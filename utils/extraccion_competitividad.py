@@ -2,6 +2,8 @@ import pandas as pd
 import streamlit as st
 import plotly.graph_objects as go
 
+from utils.utils_kpis import MIN_SOPORTE, tasas_por_grupo
+
 
 def calcular_competitividad(df):
     """
@@ -20,9 +22,10 @@ def calcular_competitividad(df):
     m = {}  # Diccionario acumulador de métricas
 
     # Porcentaje de superhosts (si hay columna disponible)
-    # reflects mayor profesionalización del anfitrión
-    if "host_is_superhost" in df.columns:
-        m["prof"] = (df["host_is_superhost"] == "t").mean() * 100
+    # reflects mayor profesionalización del anfitrión.
+    # Se usa la bandera booleana normalizada en la ingesta.
+    if "es_superhost" in df.columns:
+        m["prof"] = df["es_superhost"].mean() * 100
     else:
         m["prof"] = 0
 
@@ -102,59 +105,223 @@ def render_radar_competitividad(m, ciudad, PALETTE):
 
 
 
-def render_vecindarios_profesionalismo(df):
+def render_vecindarios_profesionalismo(df, min_soporte=MIN_SOPORTE):
     """
     Genera una gráfica de barras que muestra el porcentaje
     de superhosts por vecindario.
 
     Esta representación permite identificar concentraciones geográficas
-    asociadas a calidad del anfitrión.
+    asociadas a calidad del anfitrión. Cada barra lleva su intervalo de
+    confianza de Wilson al 95 % y se omiten los barrios con menos de
+    `min_soporte` listings, cuyo porcentaje no es representativo.
     """
 
     # Condición mínima para poder calcular métricas por vecindario
-    if "barrio_std" not in df.columns or "host_is_superhost" not in df.columns:
+    if "barrio_std" not in df.columns or "es_superhost" not in df.columns:
         st.info("No hay datos suficientes para analizar vecindarios.")
         return
 
-    # Se agrupa por barrio y se calcula el porcentaje de superhosts
-    t = (
-        df.groupby("barrio_std")["host_is_superhost"]
-        .apply(lambda x: (x == "t").mean() * 100)
-        .reset_index(name="superhost_pct")
-    )
+    # Porcentaje de superhosts, soporte e intervalo de confianza por barrio
+    t = tasas_por_grupo(df, "barrio_std", "es_superhost")
 
-    # Se muestran solo barrios con valores positivos
-    t = t[t["superhost_pct"] > 0]
+    # Se muestran solo barrios con soporte suficiente y valores positivos
+    omitidos = int((t["n"] < min_soporte).sum())
+    t = t[(t["n"] >= min_soporte) & (t["tasa"] > 0)]
 
     fig = go.Figure()
     fig.add_bar(
         x=t["barrio_std"],
-        y=t["superhost_pct"]
+        y=t["tasa"],
+        customdata=t[["n", "ic_inf", "ic_sup"]],
+        error_y=dict(
+            type="data",
+            symmetric=False,
+            array=t["ic_sup"] - t["tasa"],
+            arrayminus=t["tasa"] - t["ic_inf"],
+        ),
+        hovertemplate=(
+            "<b>%{x}</b><br>Superhosts: %{y:.1f} %"
+            "<br>IC 95 %: %{customdata[1]:.1f} – %{customdata[2]:.1f} %"
+            "<br>Listings: %{customdata[0]}<extra></extra>"
+        ),
     )
 
     fig.update_layout(height=400)
 
     st.plotly_chart(fig, use_container_width=True)
 
+    if omitidos:
+        st.caption(f"{omitidos} barrios con menos de {min_soporte} listings no se muestran.")
+
+
+
+def calcular_competitividad_grupos(df, claves, indice=None):
+    """
+    Calcula las métricas de calcular_competitividad para todos los grupos
+    definidos por `claves` (p. ej. ["ciudad"] o ["ciudad", "barrio_std"])
+    en una sola pasada groupby().agg, sin filtrar el DataFrame por grupo.
+
+    Retorna un DataFrame indexado por las claves con las columnas
+    prof, flex, amen, precio e index. Si se pasa `indice`, el resultado
+    se reordena según él (los grupos sin filas quedan en NaN).
+    """
+    tmp = pd.DataFrame({c: df[c] for c in claves})
+    agregaciones = {}
+
+    if "es_superhost" in df.columns:
+        tmp["_prof"] = df["es_superhost"].astype(float)
+        agregaciones["prof"] = ("_prof", "mean")
+    if "instant_bookable" in df.columns:
+        tmp["_flex"] = (df["instant_bookable"] == "t").astype(float)
+        agregaciones["flex"] = ("_flex", "mean")
+    if "amenities_count" in df.columns:
+        tmp["_amen"] = df["amenities_count"]
+        agregaciones["amen"] = ("_amen", "mean")
+    if "price" in df.columns:
+        tmp["_price"] = df["price"]
+        agregaciones["p_media"] = ("_price", "mean")
+        agregaciones["p_std"] = ("_price", "std")
+
+    g = tmp.groupby(claves, sort=False).agg(**agregaciones) if agregaciones \
+        else tmp.groupby(claves, sort=False).size().to_frame("_n")
+    if indice is not None:
+        g = g.reindex(indice)
+
+    res = pd.DataFrame(index=g.index)
+    res["prof"] = g["prof"] * 100 if "prof" in g else 0
+    res["flex"] = g["flex"] * 100 if "flex" in g else 0
+    res["amen"] = (g["amen"] / 15 * 100).clip(upper=100) if "amen" in g else 0
+    if "p_media" in g:
+        cv = g["p_std"] / g["p_media"] * 100
+        res["precio"] = (cv / 50 * 100).clip(upper=100)
+    else:
+        res["precio"] = 0
+
+    return _ponderar(res)
+
+
+def _ponderar(res):
+    """
+    Índice final ponderado a partir de las columnas prof, flex, amen y precio
+    (mismos pesos que calcular_competitividad).
+    """
+    res["index"] = (
+        res["prof"] * 0.4 +
+        res["flex"] * 0.3 +
+        res["amen"] * 0.2 +
+        res["precio"] * 0.1
+    )
+    return res
+
+
+# Nivel más fino de los agregados parciales de competitividad
+CLAVES_COMPETITIVIDAD = ["ciudad", "barrio_std", "room_type"]
+
+
+def parciales_competitividad(df):
+    """
+    Agregados parciales del índice de competitividad por
+    ciudad × barrio × room_type: conteos, sumas y sumas de cuadrados.
+
+    Los parciales son combinables (basta con sumarlos), por lo que el índice
+    de cualquier selección de ciudades, barrios o tipos de alojamiento se
+    obtiene con componer_competitividad sin volver a recorrer los listings.
+    Las columnas de amenidades y precio solo se crean si existen en df.
+    """
+    claves = [c for c in CLAVES_COMPETITIVIDAD if c in df.columns]
+    tmp = pd.DataFrame({c: df[c] for c in claves})
+    tmp["n"] = 1
+
+    if "es_superhost" in df.columns:
+        tmp["prof_suma"] = df["es_superhost"].astype(float)
+    if "instant_bookable" in df.columns:
+        tmp["flex_suma"] = (df["instant_bookable"] == "t").astype(float)
+    if "amenities_count" in df.columns:
+        tmp["amen_suma"] = df["amenities_count"].fillna(0).astype(float)
+        tmp["amen_n"] = df["amenities_count"].notna().astype(int)
+    if "price" in df.columns:
+        precio = df["price"].astype(float)
+        tmp["precio_suma"] = precio.fillna(0)
+        tmp["precio_suma2"] = (precio ** 2).fillna(0)
+        tmp["precio_n"] = precio.notna().astype(int)
+
+    return tmp.groupby(claves, dropna=False, sort=False).sum().reset_index()
+
+
+@st.cache_data(show_spinner=False)
+def parciales_cacheados(_df, version):
+    """
+    Parciales de competitividad cacheados por versión de datos
+    (ver utils_datos.version_datos).
+    """
+    return parciales_competitividad(_df)
+
 
+def componer_competitividad(parciales, claves=None, mascara=None):
+    """
+    Índice de competitividad a partir de los agregados parciales.
+
+    claves  → columnas por las que agrupar el resultado (None = un solo total)
+    mascara → selección booleana sobre las filas de `parciales`
+
+    La desviación del precio se obtiene de la suma de cuadrados
+    (varianza muestral, como pandas). Retorna un DataFrame con
+    n, prof, flex, amen, precio e index.
+    """
+    p = parciales if mascara is None else parciales[mascara]
+    sumas = [c for c in p.columns if c not in CLAVES_COMPETITIVIDAD]
+    if claves:
+        g = p.groupby(claves, sort=False)[sumas].sum()
+    else:
+        g = p[sumas].sum().to_frame().T
+
+    n = g["n"].where(g["n"] > 0)
+    res = pd.DataFrame({"n": g["n"]}, index=g.index)
+    res["prof"] = g["prof_suma"] / n * 100 if "prof_suma" in g else 0
+    res["flex"] = g["flex_suma"] / n * 100 if "flex_suma" in g else 0
 
-def calcular_competitividad_ciudades(df, ciudades):
+    if "amen_suma" in g:
+        res["amen"] = (g["amen_suma"] / g["amen_n"].where(g["amen_n"] > 0) / 15 * 100).clip(upper=100)
+    else:
+        res["amen"] = 0
+
+    if "precio_suma" in g:
+        m = g["precio_n"].where(g["precio_n"] > 0)
+        media = g["precio_suma"] / m
+        var = ((g["precio_suma2"] - g["precio_suma"] ** 2 / m) / (m - 1).where(m > 1)).clip(lower=0)
+        cv = var ** 0.5 / media * 100
+        res["precio"] = (cv / 50 * 100).clip(upper=100)
+    else:
+        res["precio"] = 0
+
+    return _ponderar(res)
+
+
+def calcular_competitividad_ciudades(df, ciudades, por_barrio=False):
     """
     Ejecuta el cálculo de competitividad para cada ciudad seleccionada.
 
     El retorno es un DataFrame con una fila por ciudad,
     facilitando posteriormente comparaciones o gráficas.
+    Con por_barrio=True se obtiene una fila por ciudad y barrio
+    (columna adicional "Barrio").
+
+    Todas las ciudades se calculan en una sola agrupación
+    (calcular_competitividad_grupos); las ciudades sin datos quedan en NaN.
     """
 
-    rows = []
+    sub_df = df[df["ciudad"].isin(ciudades)]
 
-    for c in ciudades:
-        sub_df = df[df["ciudad"] == c]  # se filtra por ciudad
-        m = calcular_competitividad(sub_df)
-        m["Ciudad"] = c  # etiqueta de identificación
-        rows.append(m)
+    if por_barrio:
+        res = calcular_competitividad_grupos(sub_df, ["ciudad", "barrio_std"]).reset_index()
+        res = res.rename(columns={"ciudad": "Ciudad", "barrio_std": "Barrio"})
+        orden = {c: k for k, c in enumerate(ciudades)}
+        res = res.sort_values("Ciudad", key=lambda s: s.map(orden), kind="stable")
+        return res[["prof", "flex", "amen", "precio", "index", "Ciudad", "Barrio"]].reset_index(drop=True)
 
-    return pd.DataFrame(rows)
+    res = calcular_competitividad_grupos(sub_df, ["ciudad"], indice=pd.Index(list(ciudades), name="ciudad"))
+    res["Ciudad"] = list(ciudades)
+    return res.reset_index(drop=True)
 
 
 
@@ -1,7 +1,389 @@
+import base64
+import struct
+import zlib
+
+import numpy as np
 import streamlit as st
 import plotly.express as px
+import plotly.graph_objects as go
 import pandas as pd
 
+from utils.utils_datos import pois_de_tipo
+from utils.utils_espacial import (
+    DECIMALES_HOVER,
+    MAX_PUNTOS_MAPA,
+    UMBRAL_PUNTOS_MAPA,
+    agregar_rejilla,
+    celda_para_zoom,
+    compactar_columnas,
+    preparar_puntos_mapa,
+    raster_densidad,
+    zoom_ajustado,
+)
+
+
+# Colores por ciudad usados en el mapa comparativo (mismos que la distribución por ciudad)
+COLORES_CIUDADES = {
+    "Amsterdam": "#1f77b4",
+    "Atenas": "#2ca02c",
+    "Barcelona": "#d62728",
+    "Milan": "#ff7f0e",
+    "Madrid": "#9467bd",
+}
+
+# Máximo de trazas en que se separan los puntos para no repetir textos de hover
+MAX_TRAZAS_HOVER = 80
+
+
+def figura_mapa(
+    df_geo,
+    color=None,
+    hover_name=None,
+    hover_data=None,
+    title=None,
+    mapbox_style="open-street-map",
+    height=500,
+    zoom=None,
+    center=None,
+    color_continuous_scale=None,
+    tamano_punto=None,
+    opacidad=None,
+    umbral=UMBRAL_PUNTOS_MAPA,
+):
+    """
+    Construye un mapa de listings con scatter_mapbox.
+
+    Con pocos puntos (hasta `umbral`) se dibuja cada listing. Con más puntos
+    se agregan en una rejilla cuadrada cuya resolución depende del zoom,
+    y cada celda se dibuja como un marcador con tamaño según el número de
+    listings y color según:
+        - la media de `color` si es numérica (p. ej. precio medio),
+        - la categoría `color` si es categórica (una rejilla por categoría),
+        - el conteo si no se indica color o la categoría tiene un único valor.
+    Así el tamaño del mapa depende del número de celdas y no de listings.
+
+    En ambos casos los datos pasan por el optimizador de payload
+    (utils_espacial.preparar_puntos_mapa / compactar_columnas): coordenadas
+    cuantizadas a 1e-5° en float32, textos de hover sin repetir y un tope
+    de MAX_PUNTOS_MAPA puntos muestreados por barrio.
+    """
+    if zoom is None:
+        zoom = zoom_ajustado(df_geo["latitude"], df_geo["longitude"])
+    if center is None:
+        center = {"lat": df_geo["latitude"].mean(), "lon": df_geo["longitude"].mean()}
+
+    if len(df_geo) <= umbral:
+        if isinstance(hover_data, dict):
+            columnas_hover = [c for c, mostrar in hover_data.items() if mostrar]
+        else:
+            columnas_hover = list(hover_data or [])
+        puntos = preparar_puntos_mapa(df_geo, [color, hover_name] + columnas_hover)
+        fig = _figura_puntos(
+            puntos,
+            color=color,
+            hover_name=hover_name,
+            columnas_hover=columnas_hover,
+            color_continuous_scale=color_continuous_scale,
+            tamano_punto=tamano_punto,
+            opacidad=opacidad,
+        )
+        fig.update_layout(
+            title=title,
+            height=height,
+            mapbox=dict(style=mapbox_style, zoom=zoom, center=center),
+            margin=dict(t=60 if title else 10, b=10, l=10, r=10),
+        )
+        return fig
+
+    # La resolución de la rejilla depende del zoom.
+    # Una variable categórica con un solo valor no aporta color: se colorea por conteo
+    es_numerico = color is not None and pd.api.types.is_numeric_dtype(df_geo[color])
+    es_categorico = color is not None and not es_numerico and df_geo[color].nunique() > 1
+
+    celda_lat, celda_lon = celda_para_zoom(zoom, center["lat"])
+    celdas = agregar_rejilla(
+        df_geo,
+        celda_lat,
+        celda_lon,
+        valor=color if es_numerico else None,
+        grupo=color if es_categorico else None,
+    )
+    celdas = compactar_columnas(celdas)
+
+    if es_numerico:
+        color_celdas = f"{color}_mean"
+    elif es_categorico:
+        color_celdas = color
+    else:
+        color_celdas = "n"
+
+    fig = px.scatter_mapbox(
+        celdas,
+        lat="latitude",
+        lon="longitude",
+        color=color_celdas,
+        size="n",
+        size_max=14,
+        hover_data={"n": True},
+        title=title,
+        mapbox_style=mapbox_style,
+        height=height,
+        zoom=zoom,
+        center=center,
+        color_continuous_scale=color_continuous_scale,
+    )
+    fig.update_traces(marker=dict(opacity=0.8))
+    return fig
+
+
+def _figura_puntos(
+    puntos,
+    color=None,
+    hover_name=None,
+    columnas_hover=(),
+    color_continuous_scale=None,
+    tamano_punto=None,
+    opacidad=None,
+):
+    """
+    Mapa de puntos individuales a partir de la tabla de preparar_puntos_mapa.
+
+    Los textos del hover (hover_name y columnas categóricas) no se repiten
+    en cada punto: los puntos se separan en una traza por categoría y el
+    texto se escribe una sola vez en el hovertemplate de la traza. Las
+    variables numéricas viajan en customdata (float32). Si hay demasiadas
+    combinaciones de categorías (más de MAX_TRAZAS_HOVER), hover_name se
+    envía punto a punto.
+    """
+    es_numerico = color is not None and pd.api.types.is_numeric_dtype(puntos[color]) \
+        and not pd.api.types.is_bool_dtype(puntos[color])
+    es_categorico = color is not None and not es_numerico
+
+    textos = [c for c in dict.fromkeys([hover_name] + list(columnas_hover))
+              if c and not pd.api.types.is_numeric_dtype(puntos[c])]
+    numericas = [c for c in columnas_hover
+                 if c != hover_name and pd.api.types.is_numeric_dtype(puntos[c])]
+
+    llaves = ([color] if es_categorico else []) + textos
+    combinaciones = 1
+    for c in llaves:
+        combinaciones *= max(puntos[c].nunique(), 1)
+    if combinaciones > MAX_TRAZAS_HOVER:
+        textos = [c for c in textos if c != hover_name]
+        llaves = ([color] if es_categorico else []) + textos
+    texto_por_punto = hover_name is not None and hover_name not in textos
+
+    paleta = px.defaults.color_discrete_sequence or px.colors.qualitative.Plotly
+    colores = {}
+    if es_categorico:
+        for k, valor in enumerate(puntos[color].dropna().unique()):
+            colores[valor] = COLORES_CIUDADES.get(valor, paleta[k % len(paleta)]) \
+                if color == "ciudad" else paleta[k % len(paleta)]
+
+    grupos = puntos.groupby(llaves, observed=True, sort=False, dropna=False) if llaves else [((), puntos)]
+    fig = go.Figure()
+    en_leyenda = set()
+
+    for valores, sub in grupos:
+        valores = valores if isinstance(valores, tuple) else (valores,)
+        etiquetas = dict(zip(llaves, valores))
+
+        plantilla = ""
+        if hover_name is not None and not texto_por_punto:
+            plantilla += f"<b>{etiquetas[hover_name]}</b><br><br>"
+        elif texto_por_punto:
+            plantilla += "<b>%{hovertext}</b><br><br>"
+        for c in textos:
+            if c != hover_name:
+                plantilla += f"{c}={etiquetas[c]}<br>"
+        if es_categorico:
+            plantilla += f"{color}={etiquetas[color]}<br>"
+        plantilla += "latitude=%{lat}<br>longitude=%{lon}"
+        for k, c in enumerate(numericas):
+            plantilla += f"<br>{c}=%{{customdata[{k}]}}"
+        plantilla += "<extra></extra>"
+
+        marcador = {}
+        if tamano_punto is not None:
+            marcador["size"] = tamano_punto
+        if opacidad is not None:
+            marcador["opacity"] = opacidad
+        if es_numerico:
+            marcador["color"] = sub[color].to_numpy()
+            marcador["coloraxis"] = "coloraxis"
+            if color not in numericas:
+                plantilla = plantilla.replace("<extra>", f"<br>{color}=%{{marker.color}}<extra>")
+
+        nombre = None
+        if es_categorico:
+            valor = etiquetas[color]
+            nombre = str(valor)
+            marcador["color"] = colores.get(valor, "#9e9e9e")
+
+        fig.add_trace(go.Scattermapbox(
+            lat=sub["latitude"].to_numpy(),
+            lon=sub["longitude"].to_numpy(),
+            mode="markers",
+            marker=marcador,
+            customdata=sub[numericas].to_numpy() if numericas else None,
+            hovertext=sub[hover_name].astype(str).to_numpy() if texto_por_punto else None,
+            hovertemplate=plantilla,
+            name=nombre,
+            legendgroup=nombre,
+            showlegend=es_categorico and nombre not in en_leyenda,
+        ))
+        en_leyenda.add(nombre)
+
+    if es_numerico:
+        fig.update_layout(coloraxis=dict(
+            colorscale=color_continuous_scale,
+            colorbar=dict(title=color),
+        ))
+    if es_categorico:
+        fig.update_layout(legend_title_text=color)
+    if px.defaults.template is not None:
+        fig.update_layout(template=px.defaults.template)
+    return fig
+
+
+def _png_data_uri(rgba):
+    """
+    Codifica una matriz RGBA (alto × ancho × 4, uint8) como PNG en data URI.
+    Se usa zlib directamente para no depender de librerías de imágenes.
+    """
+    alto, ancho, _ = rgba.shape
+    filas = np.concatenate(
+        [np.zeros((alto, 1), dtype=np.uint8), rgba.reshape(alto, ancho * 4)], axis=1
+    )
+
+    def chunk(tipo, datos):
+        return (
+            struct.pack(">I", len(datos)) + tipo + datos
+            + struct.pack(">I", zlib.crc32(tipo + datos) & 0xFFFFFFFF)
+        )
+
+    png = (
+        b"\x89PNG\r\n\x1a\n"
+        + chunk(b"IHDR", struct.pack(">IIBBBBB", ancho, alto, 8, 6, 0, 0, 0))
+        + chunk(b"IDAT", zlib.compress(filas.tobytes(), 6))
+        + chunk(b"IEND", b"")
+    )
+    return "data:image/png;base64," + base64.b64encode(png).decode("ascii")
+
+
+def _capa_densidad(densidad, extension, color_hex):
+    """
+    Convierte un raster de densidad en una capa de imagen de Mapbox.
+    La intensidad se expresa como transparencia del color de la ciudad,
+    con escala raíz cuadrada para no saturar los centros más densos.
+    """
+    maximo = densidad.max()
+    intensidad = np.sqrt(densidad / maximo) if maximo > 0 else densidad
+
+    rgb = [int(color_hex[i:i + 2], 16) for i in (1, 3, 5)]
+    rgba = np.zeros(densidad.shape + (4,), dtype=np.uint8)
+    rgba[..., :3] = rgb
+    # 32 niveles de transparencia bastan visualmente y comprimen mucho mejor en PNG
+    rgba[..., 3] = (np.round(intensidad * 31) * 7).astype(np.uint8)
+
+    lat_min, lat_max, lon_min, lon_max = extension
+    return {
+        "sourcetype": "image",
+        "source": _png_data_uri(rgba),
+        "coordinates": [
+            [lon_min, lat_max],
+            [lon_max, lat_max],
+            [lon_max, lat_min],
+            [lon_min, lat_min],
+        ],
+        "below": "traces",
+    }
+
+
+def figura_mapa_densidad(df_geo, grupo="ciudad", resolucion=256, sigma=1.5, height=500):
+    """
+    Mapa de densidad rasterizado en el servidor.
+
+    Para cada valor de `grupo` (ciudad) se calcula un histograma 2D de
+    tamaño fijo, opcionalmente suavizado, y se envía como imagen PNG
+    superpuesta al mapa. El tamaño del mapa depende del número de ciudades
+    y de la resolución, no del número de listings. Se añade un marcador por
+    ciudad en su centro para conservar leyenda y hover.
+    """
+    capas = []
+    centros = []
+    paleta = px.colors.qualitative.Plotly
+
+    for k, (nombre, sub) in enumerate(df_geo.groupby(grupo, sort=True)):
+        if sub.empty:
+            continue
+        densidad, extension = raster_densidad(
+            sub["latitude"], sub["longitude"], resolucion=resolucion, sigma=sigma
+        )
+        color = COLORES_CIUDADES.get(nombre, paleta[k % len(paleta)])
+        capas.append(_capa_densidad(densidad, extension, color))
+        centros.append({
+            grupo: nombre,
+            "latitude": sub["latitude"].median(),
+            "longitude": sub["longitude"].median(),
+            "listings": len(sub),
+        })
+
+    centros = pd.DataFrame(centros)
+    zoom = zoom_ajustado(centros["latitude"], centros["longitude"]) if len(centros) > 1 else 11
+
+    fig = px.scatter_mapbox(
+        centros,
+        lat="latitude",
+        lon="longitude",
+        color=grupo,
+        hover_data={"listings": True},
+        color_discrete_map=COLORES_CIUDADES,
+        mapbox_style="open-street-map",
+        height=height,
+        zoom=zoom,
+    )
+    fig.update_traces(marker=dict(size=6))
+    fig.update_layout(mapbox_layers=capas)
+    return fig
+
+
+def figura_coropletas(agr, geojson, valor, zoom, center, titulo_color=None,
+                      color_continuous_scale=None, height=500):
+    """
+    Mapa de coropletas por barrio.
+
+    `agr` es una tabla agregada por barrio_std (una fila por barrio) y
+    `geojson` la geometría simplificada de utils_datos.barrios_geojson.
+    Solo se envían los polígonos de los barrios presentes en `agr`, de modo
+    que el tamaño del mapa depende del número de barrios y no de listings.
+    """
+    agr = agr.dropna(subset=[valor])
+    presentes = set(agr["barrio_std"])
+    geojson = {
+        "type": "FeatureCollection",
+        "features": [f for f in geojson["features"] if f["properties"]["neighbourhood"] in presentes],
+    }
+
+    fig = go.Figure(go.Choroplethmapbox(
+        geojson=geojson,
+        featureidkey="properties.neighbourhood",
+        locations=agr["barrio_std"],
+        z=agr[valor].round(DECIMALES_HOVER),
+        colorscale=color_continuous_scale,
+        marker=dict(opacity=0.7, line=dict(width=0.5, color="white")),
+        colorbar=dict(title=titulo_color or valor),
+        hovertemplate="<b>%{location}</b><br>%{z}<extra></extra>",
+    ))
+    fig.update_layout(
+        height=height,
+        mapbox=dict(style="carto-positron", zoom=zoom, center=center),
+        margin=dict(t=10, b=10, l=10, r=10),
+    )
+    if px.defaults.template is not None:
+        fig.update_layout(template=px.defaults.template)
+    return fig
+
 
 def render_mapa_ciudad(df_city):
     """
@@ -21,10 +403,9 @@ def render_mapa_ciudad(df_city):
 
     # Mapa geográfico de puntos donde cada punto representa una propiedad.
     # Si existe la variable price, se utiliza para colorear los puntos y generar un gradiente visual por costo.
-    fig = px.scatter_mapbox(
+    # Con muchos listings, figura_mapa agrega los puntos en celdas coloreadas por precio medio.
+    fig = figura_mapa(
         df_geo,
-        lat="latitude",
-        lon="longitude",
         color="price" if "price" in df_geo else None,
         mapbox_style="open-street-map",
         height=500,
@@ -58,14 +439,16 @@ def render_mapa_comparativo(df):
 
     # Construcción del mapa donde cada punto está asociado a una ciudad específica.
     # El color permite distinguir visualmente la procedencia urbana de cada registro.
-    fig = px.scatter_mapbox(
-        df_geo,
-        lat="latitude",
-        lon="longitude",
-        color="ciudad",
-        mapbox_style="open-street-map",
-        height=500
-    )
+    # Con muchos listings se usa un raster de densidad por ciudad, cuyo tamaño es constante.
+    if len(df_geo) > UMBRAL_PUNTOS_MAPA:
+        fig = figura_mapa_densidad(df_geo, grupo="ciudad")
+    else:
+        fig = figura_mapa(
+            df_geo,
+            color="ciudad",
+            mapbox_style="open-street-map",
+            height=500
+        )
 
     st.plotly_chart(fig, use_container_width=True)
 
@@ -83,52 +466,46 @@ def render_mapa_turismo_transporte():
         - potencial atractivo del entorno.
     """
 
-    import os
 
-    # Se obtiene la ruta del archivo externo que contiene ubicaciones turísticas y de transporte.
-    csv_path = os.path.join(os.path.dirname(__file__), '../data/tourism_transport_map_data_full.csv')
-    df_map = pd.read_csv(csv_path)
-
-    # Filtrado de filas clasificadas como sitios turísticos.
-    df_tourist = df_map[df_map['Type'] == 'Tourist Spot']
+    # POIs cargados una vez por versión del archivo y ya separados por tipo;
+    # en visitas repetidas no se lee el disco.
+    df_tourist = pois_de_tipo("Tourist Spot")
 
     # Si existen registros turísticos, se construye un mapa específico.
     if not df_tourist.empty:
         st.markdown("#### Mapa de Sitios Turísticos")
 
         # Cada punto en el mapa representa un punto turístico identificado con su nombre.
-        fig_tourist = px.scatter_mapbox(
-            df_tourist,
-            lat="Latitude",
-            lon="Longitude",
-            hover_name="Name",
+        fig_tourist = figura_mapa(
+            df_tourist.rename(columns={"Latitude": "latitude", "Longitude": "longitude"}),
             color="City",
+            hover_name="Name",
             mapbox_style="carto-positron",
             height=400,
-            zoom=3
+            zoom=3,
+            umbral=MAX_PUNTOS_MAPA,
         )
 
         st.plotly_chart(fig_tourist, use_container_width=True)
     else:
         st.info("No existen registros turísticos disponibles.")
 
-    # Filtrado de filas clasificadas como puntos o nodos de transporte.
-    df_transport = df_map[df_map['Type'] == 'Transport Hub']
+    # Puntos o nodos de transporte.
+    df_transport = pois_de_tipo("Transport Hub")
 
     # Si existen registros, se construye un mapa con ellos.
     if not df_transport.empty:
         st.markdown("#### Mapa de Rutas y Hubs de Transporte")
 
         # Esta vista permite reconocer conectividad urbana y proximidad a zonas relevantes.
-        fig_transport = px.scatter_mapbox(
-            df_transport,
-            lat="Latitude",
-            lon="Longitude",
-            hover_name="Name",
+        fig_transport = figura_mapa(
+            df_transport.rename(columns={"Latitude": "latitude", "Longitude": "longitude"}),
             color="City",
+            hover_name="Name",
             mapbox_style="carto-positron",
             height=400,
-            zoom=3
+            zoom=3,
+            umbral=MAX_PUNTOS_MAPA,
         )
 
         st.plotly_chart(fig_transport, use_container_width=True)
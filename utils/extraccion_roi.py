@@ -0,0 +1,377 @@
+from html import escape
+
+import numpy as np
+import pandas as pd
+import streamlit as st
+import plotly.express as px
+
+
+# Tasas aproximadas de ocupación por ciudad.
+# Valores referenciales basados en reportes del mercado europeo; solo se usan
+# cuando el dataset no trae ocupación estimada por listing (ver ocupaciones_ciudades).
+OCUPACION_REFERENCIA = {
+    "Barcelona": 0.68,
+    "Amsterdam": 0.62,
+    "Milan": 0.65,
+    "Athens": 0.70,
+    "Atenas": 0.70,
+    "Madrid": 0.67,
+}
+OCUPACION_DEFECTO = 0.65
+
+# Costos iniciales estimados por ciudad (setting cost)
+COSTOS_SETUP = {
+    "Barcelona": 8000,
+    "Amsterdam": 12000,
+    "Milan": 7000,
+    "Athens": 5000,
+    "Atenas": 5000,
+    "Madrid": 6500,
+}
+SETUP_DEFECTO = 7000
+
+# Descuentos sobre el revenue bruto
+COMISION_AIRBNB = 0.15
+COSTOS_LIMPIEZA = 0.05
+
+# Meses de gastos operativos que se suman a la inversión inicial
+MESES_INVERSION = 8
+
+# Rejillas de escenarios: gastos mensuales (mismo rango y paso que el selector),
+# ocupación y comisión de la plataforma
+GASTOS_GRID = np.arange(200, 3001, 50)
+OCUPACION_GRID = np.round(np.arange(0.40, 0.951, 0.05), 2)
+COMISION_GRID = np.array([0.03, 0.10, 0.15, 0.20])
+
+
+def calcular_roi(precio, ocupacion, gastos_mensuales, setup,
+                 comision=COMISION_AIRBNB, limpieza=COSTOS_LIMPIEZA):
+    """
+    Modelo de ROI anual de un listing, vectorizado.
+
+    Todos los argumentos pueden ser escalares o arreglos de NumPy con formas
+    compatibles: el resultado sigue las reglas de broadcasting, de modo que
+    una sola llamada evalúa cualquier combinación de ciudades y escenarios.
+
+    Retorna
+    -------
+    dict con dias_ocupados, revenue_bruto, revenue_neto, ganancia_neta,
+    inversion_inicial y roi (%).
+    """
+    precio = np.asarray(precio, dtype=float)
+    ocupacion = np.asarray(ocupacion, dtype=float)
+    gastos_mensuales = np.asarray(gastos_mensuales, dtype=float)
+    setup = np.asarray(setup, dtype=float)
+
+    dias_ocupados = ocupacion * 365
+    revenue_bruto = precio * dias_ocupados
+    revenue_neto = revenue_bruto * (1 - comision - limpieza)
+    ganancia_neta = revenue_neto - gastos_mensuales * 12
+    inversion_inicial = setup + gastos_mensuales * MESES_INVERSION
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        roi = np.where(inversion_inicial > 0, ganancia_neta / inversion_inicial * 100, 0.0)
+
+    return {
+        "dias_ocupados": dias_ocupados,
+        "revenue_bruto": revenue_bruto,
+        "revenue_neto": revenue_neto,
+        "ganancia_neta": ganancia_neta,
+        "inversion_inicial": inversion_inicial,
+        "roi": roi,
+    }
+
+
+def ocupaciones_ciudades(tabla_ocupacion):
+    """
+    Serie ciudad → ocupación media estimada a partir del nivel "ciudad" de
+    utils_kpis.ocupacion_revenue_cacheada.
+    """
+    if tabla_ocupacion.empty:
+        return pd.Series(dtype=float)
+    return tabla_ocupacion.set_index("ciudad")["ocupacion_media"].dropna()
+
+
+def supuestos_ciudades(ciudades, precios, ocupaciones=None):
+    """
+    Arreglos alineados con `ciudades` con precio medio, ocupación y costo
+    de setup de cada ciudad. La ocupación sale de los datos (`ocupaciones`,
+    ciudad → fracción del año) y, si no hay dato, de OCUPACION_REFERENCIA.
+    """
+    precios = pd.Series(precios, dtype=float)
+    ocupaciones = pd.Series(ocupaciones if ocupaciones is not None else {}, dtype=float)
+    return (
+        np.array([precios.get(c, 0.0) for c in ciudades], dtype=float),
+        np.array([
+            ocupaciones.get(c, np.nan) if pd.notna(ocupaciones.get(c, np.nan))
+            else OCUPACION_REFERENCIA.get(c, OCUPACION_DEFECTO)
+            for c in ciudades
+        ]),
+        np.array([COSTOS_SETUP.get(c, SETUP_DEFECTO) for c in ciudades], dtype=float),
+    )
+
+
+@st.cache_data(show_spinner=False)
+def cubo_roi(ciudades: tuple, precios: tuple, setups: tuple,
+             gastos=tuple(GASTOS_GRID), ocupaciones=tuple(OCUPACION_GRID),
+             comisiones=tuple(COMISION_GRID)) -> dict:
+    """
+    Cubo de escenarios de ROI: ciudades × gastos × ocupación × comisión,
+    evaluado en una sola llamada con broadcasting.
+
+    Retorna un dict con el arreglo "roi" de forma (C, G, O, K) y los ejes.
+    Se cachea por supuestos, que son tuplas pequeñas y baratas de hashear.
+    """
+    r = calcular_roi(
+        precio=np.asarray(precios)[:, None, None, None],
+        ocupacion=np.asarray(ocupaciones)[None, None, :, None],
+        gastos_mensuales=np.asarray(gastos)[None, :, None, None],
+        setup=np.asarray(setups)[:, None, None, None],
+        comision=np.asarray(comisiones)[None, None, None, :],
+    )
+    return {
+        "roi": r["roi"],
+        "ciudades": list(ciudades),
+        "gastos": np.asarray(gastos),
+        "ocupaciones": np.asarray(ocupaciones),
+        "comisiones": np.asarray(comisiones),
+    }
+
+
+@st.cache_data(show_spinner=False)
+def escenarios_ranking(ciudades: tuple, precios: tuple, ocupaciones: tuple,
+                       setups: tuple, gastos=tuple(GASTOS_GRID)) -> dict:
+    """
+    Métricas del ranking de ROI para todas las ciudades y todos los valores
+    de la rejilla de gastos, con la ocupación propia de cada ciudad.
+
+    Retorna dict métrica → arreglo (C, G). El selector de gastos solo
+    elige una columna de este resultado cacheado.
+    """
+    r = calcular_roi(
+        precio=np.asarray(precios)[:, None],
+        ocupacion=np.asarray(ocupaciones)[:, None],
+        gastos_mensuales=np.asarray(gastos)[None, :],
+        setup=np.asarray(setups)[:, None],
+    )
+    forma = r["roi"].shape
+    r = {k: np.broadcast_to(v, forma) for k, v in r.items()}
+    r["gastos"] = np.asarray(gastos)
+    return r
+
+
+def ranking_roi(ciudades, precios, gastos_mensuales, ocupaciones=None):
+    """
+    Tabla del ranking de ROI por ciudad para un gasto mensual,
+    ordenada de mayor a menor ROI.
+    """
+    ciudades = tuple(ciudades)
+    precio, ocupacion, setup = supuestos_ciudades(ciudades, precios, ocupaciones)
+    esc = escenarios_ranking(ciudades, tuple(precio), tuple(ocupacion), tuple(setup))
+
+    pos = np.flatnonzero(esc["gastos"] == gastos_mensuales)
+    if pos.size:
+        r = {k: v[:, pos[0]] for k, v in esc.items() if k != "gastos"}
+    else:
+        # Valor fuera de la rejilla: se evalúa directamente (una llamada vectorizada)
+        r = calcular_roi(precio, ocupacion, gastos_mensuales, setup)
+
+    tabla = pd.DataFrame({
+        "Ciudad": list(ciudades),
+        "Precio_Promedio": precio,
+        "Ocupacion_Pct": ocupacion * 100,
+        "Dias_Ocupados": r["dias_ocupados"],
+        "Revenue_Bruto": r["revenue_bruto"],
+        "Revenue_Neto": r["revenue_neto"],
+        "Inversion_Inicial": r["inversion_inicial"],
+        "Ganancia_Neta": r["ganancia_neta"],
+        "ROI": r["roi"],
+    })
+    return tabla.sort_values("ROI", ascending=False, kind="stable").reset_index(drop=True)
+
+
+@st.cache_data(show_spinner=False)
+def html_ranking_roi(ciudades: tuple, precios: tuple, ocupaciones: tuple, gastos_mensuales) -> str:
+    """
+    HTML completo del ranking de ROI por ciudad para un escenario.
+
+    La llave de caché es el escenario: ciudades, pares (ciudad, precio medio),
+    pares (ciudad, ocupación) y gasto mensual. El ranking se envía al
+    navegador en un solo st.markdown en lugar de varios por ciudad.
+    """
+    tabla = ranking_roi(ciudades, dict(precios), gastos_mensuales, dict(ocupaciones))
+
+    filas = []
+    for rank, r in enumerate(tabla.itertuples(index=False)):
+        filas.append(
+            "<div style='display:flex;align-items:flex-start;justify-content:center;margin-bottom:8px;width:100%;'>"
+            # Centro: ranking, nombre y ROI badge
+            "<div style='min-width:220px;text-align:center;'>"
+            f"<div style='font-size:1.35rem;font-weight:700;margin-bottom:2px;'>#{rank+1}: {escape(str(r.Ciudad))}</div>"
+            "<span style='background:#e3f0ff;color:#1976d2;padding:6px 22px;border-radius:8px;font-weight:600;display:inline-block;margin-top:8px;font-size:1.08rem;'>"
+            f"ROI: {r.ROI:.1f}%</span>"
+            "</div>"
+            # Métricas centradas
+            "<div style='display:flex;gap:64px;justify-content:center;margin-left:32px;'>"
+            "<div style='text-align:center;'><div style='font-size:1.12rem;color:#888;margin-bottom:2px;'>Ganancia Neta/Año</div>"
+            f"<div style='font-size:1.7rem;font-weight:700;'>€{r.Ganancia_Neta:,.0f}</div></div>"
+            "<div style='text-align:center;'><div style='font-size:1.12rem;color:#888;margin-bottom:2px;'>Revenue Neto</div>"
+            f"<div style='font-size:1.7rem;font-weight:700;'>€{r.Revenue_Neto:,.0f}</div></div>"
+            "</div>"
+            "</div>"
+            # Detalles debajo, centrados
+            "<div style='color:#888;font-size:0.99rem;margin:6px 0 0 0;text-align:center;'>"
+            f"Precio promedio: €{r.Precio_Promedio:.0f}/noche | Ocupación: {r.Ocupacion_Pct:.0f}% ({r.Dias_Ocupados:.0f} días/año)"
+            "</div>"
+            # Separador horizontal
+            "<hr style='margin:18px 0 22px 0;border:0;border-top:1px solid #eee;'>"
+        )
+
+    return "<div style='max-width:900px;margin:0 auto;'>" + "".join(filas) + "</div>"
+
+
+def render_sensibilidad_roi(cubo, ciudad, comision, gastos_actual=None):
+    """
+    Mapa de calor del ROI de una ciudad en función de gastos mensuales
+    y ocupación, para una comisión fija, leído del cubo de escenarios.
+    """
+    c = cubo["ciudades"].index(ciudad)
+    k = int(np.argmin(np.abs(cubo["comisiones"] - comision)))
+    matriz = cubo["roi"][c, :, :, k].T
+
+    fig = px.imshow(
+        matriz,
+        x=cubo["gastos"],
+        y=[f"{o:.0%}" for o in cubo["ocupaciones"]],
+        origin="lower",
+        aspect="auto",
+        color_continuous_scale="RdYlGn",
+        color_continuous_midpoint=0,
+        labels=dict(x="Gastos operativos mensuales (€)", y="Ocupación", color="ROI (%)"),
+    )
+    if gastos_actual is not None:
+        fig.add_vline(x=gastos_actual, line_dash="dash", line_color="black")
+    fig.update_layout(height=380, margin=dict(l=10, r=10, t=10, b=10))
+    st.plotly_chart(fig, use_container_width=True)
+
+
+# Parámetros de la simulación Monte Carlo del ROI
+SIMULACIONES_ROI = 100_000
+SEMILLA_ROI = 42
+# Desviación estándar de la ocupación alrededor de la referencia de cada ciudad
+SD_OCUPACION = 0.10
+# Coeficientes de variación de gastos mensuales y costo de setup
+CV_GASTOS = 0.15
+CV_SETUP = 0.20
+# Máximo de simulaciones evaluadas a la vez (controla la memoria)
+SIMULACIONES_POR_LOTE = 2_000_000
+PERCENTILES_ROI = (5, 25, 50, 75, 95)
+
+
+def simular_roi(precios_por_ciudad, ocupaciones, setups, gastos_mensuales,
+                n=SIMULACIONES_ROI, semilla=SEMILLA_ROI, ocupaciones_por_ciudad=None):
+    """
+    Simulación Monte Carlo del ROI anual por ciudad.
+
+    En cada simulación se muestrean:
+        - un listing de la ciudad, del que se toman precio por noche y,
+          si existe, su ocupación estimada (remuestreo conjunto),
+        - si el listing no tiene ocupación, una normal centrada en la
+          ocupación de la ciudad (SD_OCUPACION) y acotada a [0, 1],
+        - gastos mensuales y costo de setup de normales truncadas en cero
+          (coeficientes de variación CV_GASTOS y CV_SETUP),
+    y se evalúa calcular_roi. Todas las ciudades se simulan juntas en lotes
+    de NumPy con un generador con semilla, por lo que el resultado es
+    reproducible.
+
+    Parámetros
+    ----------
+    precios_por_ciudad : lista de arreglos con los precios de cada ciudad
+    ocupaciones, setups: arreglos con un valor por ciudad
+    ocupaciones_por_ciudad: lista opcional de arreglos alineados con
+        precios_por_ciudad con la ocupación de cada listing (NaN si falta)
+
+    Retorna
+    -------
+    DataFrame con una fila por ciudad: media, percentiles de ROI
+    (p5, p25, p50, p75, p95) y probabilidad de pérdida (ROI < 0).
+    """
+    rng = np.random.default_rng(semilla)
+    n_ciudades = len(precios_por_ciudad)
+
+    # Precios de todas las ciudades concatenados; cada ciudad ocupa un tramo
+    tamanos = np.array([len(p) for p in precios_por_ciudad])
+    inicios = np.concatenate(([0], np.cumsum(tamanos)[:-1]))
+    precios = np.concatenate([np.asarray(p, dtype=float) for p in precios_por_ciudad]) \
+        if n_ciudades else np.array([])
+    if ocupaciones_por_ciudad is not None and n_ciudades:
+        ocup_listings = np.concatenate([np.asarray(o, dtype=float) for o in ocupaciones_por_ciudad])
+    else:
+        ocup_listings = np.full(len(precios), np.nan)
+
+    ocupaciones = np.asarray(ocupaciones, dtype=float)
+    setups = np.asarray(setups, dtype=float)
+
+    roi = np.full((n_ciudades, n), np.nan)
+    ciudades_lote = max(SIMULACIONES_POR_LOTE // n, 1)
+
+    for c0 in range(0, n_ciudades, ciudades_lote):
+        c = np.arange(c0, min(c0 + ciudades_lote, n_ciudades))
+        con_precios = tamanos[c] > 0
+        if not con_precios.any():
+            continue
+        c = c[con_precios]
+        forma = (len(c), n)
+
+        idx = inicios[c, None] + (rng.random(forma) * tamanos[c, None]).astype(np.int64)
+        ocupacion = ocup_listings[idx]
+        faltantes = np.isnan(ocupacion)
+        if faltantes.any():
+            normal = np.clip(rng.normal(ocupaciones[c, None], SD_OCUPACION, size=forma), 0, 1)
+            ocupacion = np.where(faltantes, normal, ocupacion)
+        gastos = np.maximum(rng.normal(gastos_mensuales, gastos_mensuales * CV_GASTOS, size=forma), 0)
+        setup = np.maximum(rng.normal(setups[c, None], setups[c, None] * CV_SETUP, size=forma), 0)
+
+        roi[c] = calcular_roi(precios[idx], ocupacion, gastos, setup)["roi"]
+
+    validas = ~np.isnan(roi).all(axis=1)
+    percentiles = np.full((n_ciudades, len(PERCENTILES_ROI)), np.nan)
+    if validas.any():
+        percentiles[validas] = np.percentile(roi[validas], PERCENTILES_ROI, axis=1).T
+
+    res = pd.DataFrame(percentiles, columns=[f"p{q}" for q in PERCENTILES_ROI])
+    res.insert(0, "media", np.where(validas, np.nanmean(np.where(validas[:, None], roi, 0), axis=1), np.nan))
+    res["prob_perdida"] = np.where(validas, (roi < 0).mean(axis=1) * 100, np.nan)
+    return res
+
+
+@st.cache_data(show_spinner=False)
+def simular_roi_cacheado(_df, version, ciudades: tuple, gastos_mensuales,
+                         n=SIMULACIONES_ROI, semilla=SEMILLA_ROI) -> pd.DataFrame:
+    """
+    simular_roi para las ciudades indicadas, cacheado por versión de datos
+    y parámetros (ciudades, gastos, número de simulaciones y semilla).
+    """
+    columnas = ["ciudad", "price"]
+    if "ocupacion_estimada" in _df.columns:
+        columnas.append("ocupacion_estimada")
+    listings = _df.loc[_df["price"].notna(), columnas]
+    por_ciudad = dict(tuple(listings.groupby("ciudad")))
+
+    vacio = np.array([])
+    precios_por_ciudad = [por_ciudad[c]["price"].to_numpy() if c in por_ciudad else vacio for c in ciudades]
+    ocupaciones_por_ciudad = None
+    if "ocupacion_estimada" in columnas:
+        ocupaciones_por_ciudad = [
+            por_ciudad[c]["ocupacion_estimada"].to_numpy() if c in por_ciudad else vacio for c in ciudades
+        ]
+
+    ocupacion_media = listings.groupby("ciudad")["ocupacion_estimada"].mean() \
+        if "ocupacion_estimada" in columnas else None
+    _, ocupacion, setup = supuestos_ciudades(ciudades, {}, ocupacion_media)
+    res = simular_roi(
+        precios_por_ciudad, ocupacion, setup, gastos_mensuales,
+        n=n, semilla=semilla, ocupaciones_por_ciudad=ocupaciones_por_ciudad,
+    )
+    res.insert(0, "Ciudad", list(ciudades))
+    return res
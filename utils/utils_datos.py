@@ -1,8 +1,20 @@
+import os
 import re
+import json
+import hashlib
 import numpy as np
 import pandas as pd
 import streamlit as st
 
+from utils.utils_espacial import (
+    agregar_proximidad,
+    indices_espaciales,
+    nivel_zoom_geometria,
+    simplificar_geometria,
+    tolerancia_para_zoom,
+)
+from utils.utils_kpis import agregar_percentiles, distribuciones_cacheadas
+
 
 @st.cache_data
 def load_airbnb_data(file_id: str):
@@ -36,6 +48,145 @@ DRIVE_FILES = {
 }
 
 
+# Registro de geometría por ciudad: caja (lat_min, lat_max, lon_min, lon_max)
+# que contiene el área de cada ciudad con margen. Los listings fuera de su
+# caja se consideran mal geocodificados (ver validar_coordenadas).
+LIMITES_CIUDADES = {
+    "Barcelona": (41.30, 41.50, 2.05, 2.25),
+    "Amsterdam": (52.20, 52.50, 4.70, 5.10),
+    "Milan": (45.30, 45.60, 9.00, 9.40),
+    "Atenas": (37.90, 38.10, 23.60, 23.90),
+    "Madrid": (40.30, 40.60, -3.90, -3.50),
+}
+
+
+# Archivo con sitios turísticos y hubs de transporte (opcional)
+RUTA_POIS = os.path.join(os.path.dirname(__file__), "../data/tourism_transport_map_data_full.csv")
+
+# Tipos de POI presentes en el archivo
+TIPOS_POI = ["Tourist Spot", "Transport Hub"]
+
+COLUMNAS_POI = ["Name", "Type", "City", "Latitude", "Longitude"]
+
+
+@st.cache_data(show_spinner=False)
+def _hash_archivo(ruta: str, mtime_ns: int, tamano: int) -> str:
+    """
+    Hash SHA-1 del contenido de un archivo.
+    mtime y tamaño forman la llave, por lo que el archivo solo se lee
+    de nuevo cuando cambia en disco.
+    """
+    with open(ruta, "rb") as f:
+        return hashlib.sha1(f.read()).hexdigest()
+
+
+@st.cache_resource(show_spinner=False)
+def _pois_tipados(ruta: str, hash_archivo: str) -> dict:
+    """
+    Carga el archivo de POIs una vez por contenido (hash) con tipos compactos:
+    Name, Type y City categóricas; Latitude y Longitude en float32.
+
+    Retorna
+    -------
+    dict con:
+        "todos"     → DataFrame completo
+        "por_tipo"  → tipo → DataFrame
+        "por_ciudad"→ (tipo, ciudad) → DataFrame
+        "version"   → hash del archivo
+    Los DataFrames son compartidos entre sesiones y no deben modificarse.
+    """
+    df = pd.read_csv(
+        ruta,
+        usecols=COLUMNAS_POI,
+        dtype={"Name": "category", "Type": "category", "City": "category",
+               "Latitude": np.float32, "Longitude": np.float32},
+    )
+    df = df.dropna(subset=["Latitude", "Longitude"]).reset_index(drop=True)
+
+    por_tipo = {
+        tipo: grupo.reset_index(drop=True)
+        for tipo, grupo in df.groupby("Type", observed=True, sort=False)
+    }
+    por_ciudad = {
+        (tipo, ciudad): grupo.reset_index(drop=True)
+        for (tipo, ciudad), grupo in df.groupby(["Type", "City"], observed=True, sort=False)
+    }
+    return {"todos": df, "por_tipo": por_tipo, "por_ciudad": por_ciudad, "version": hash_archivo}
+
+
+def pois_cargados() -> dict:
+    """
+    POIs tipados y separados por tipo y ciudad (ver _pois_tipados).
+
+    En cada llamada solo se consulta la fecha de modificación del archivo;
+    el contenido se vuelve a leer únicamente si cambió. Si el archivo no
+    existe se devuelve la misma estructura vacía.
+    """
+    if not os.path.exists(RUTA_POIS):
+        vacio = pd.DataFrame(columns=COLUMNAS_POI)
+        return {"todos": vacio, "por_tipo": {}, "por_ciudad": {}, "version": ""}
+
+    info = os.stat(RUTA_POIS)
+    hash_archivo = _hash_archivo(RUTA_POIS, info.st_mtime_ns, info.st_size)
+    return _pois_tipados(RUTA_POIS, hash_archivo)
+
+
+def pois_de_tipo(tipo: str, ciudad: str = None) -> pd.DataFrame:
+    """
+    POIs de un tipo ("Tourist Spot", "Transport Hub"), opcionalmente de una ciudad.
+    """
+    pois = pois_cargados()
+    if ciudad is None:
+        sub = pois["por_tipo"].get(tipo)
+    else:
+        sub = pois["por_ciudad"].get((tipo, ciudad))
+    return sub if sub is not None else pd.DataFrame(columns=COLUMNAS_POI)
+
+
+# Carpeta con la geometría de barrios de cada ciudad (<ciudad>.geojson).
+# Se espera el formato de Inside Airbnb: propiedad "neighbourhood" por polígono,
+# con los mismos nombres que barrio_std.
+CARPETA_BARRIOS = os.path.join(os.path.dirname(__file__), "../data/barrios")
+
+
+def ruta_barrios(ciudad: str) -> str:
+    return os.path.join(CARPETA_BARRIOS, f"{ciudad}.geojson")
+
+
+@st.cache_resource(show_spinner=False)
+def _barrios_simplificados(ruta: str, mtime_ns: int, nivel_zoom: int) -> dict:
+    """
+    GeoJSON de barrios simplificado con Douglas–Peucker para un nivel de zoom
+    (tolerancia de un píxel). Se calcula una vez por archivo y nivel de zoom.
+    """
+    with open(ruta, encoding="utf-8") as f:
+        geojson = json.load(f)
+
+    tolerancia = tolerancia_para_zoom(nivel_zoom)
+    features = []
+    for feature in geojson.get("features", []):
+        if not feature.get("geometry"):
+            continue
+        features.append({
+            "type": "Feature",
+            "properties": {"neighbourhood": feature.get("properties", {}).get("neighbourhood")},
+            "geometry": simplificar_geometria(feature["geometry"], tolerancia),
+        })
+    return {"type": "FeatureCollection", "features": features}
+
+
+def barrios_geojson(ciudad: str, zoom: float):
+    """
+    Geometría de barrios de una ciudad, simplificada para el zoom indicado.
+    Devuelve None si no hay archivo para la ciudad. El resultado es compartido
+    entre sesiones y no debe modificarse.
+    """
+    ruta = ruta_barrios(ciudad)
+    if not os.path.exists(ruta):
+        return None
+    return _barrios_simplificados(ruta, os.stat(ruta).st_mtime_ns, nivel_zoom_geometria(zoom))
+
+
 def _to_float_price(val):
     """
     Limpia valores de precio y los convierte a flotante.
@@ -95,6 +246,16 @@ def _bathrooms_from_text(txt):
     return float(m.group(1)) if m else np.nan
 
 
+def _a_booleano(serie: pd.Series) -> pd.Series:
+    """
+    Convierte banderas de texto de Airbnb ('t'/'f') a booleano.
+
+    Se ignoran mayúsculas y espacios; cualquier otro valor,
+    incluidos los nulos, se interpreta como False.
+    """
+    return serie.astype(str).str.lower().str.strip().isin(["t", "true"])
+
+
 def limpiar_estandarizar(df: pd.DataFrame, ciudad: str) -> pd.DataFrame:
     """
     Estandariza campos de Airbnb para comparaciones equivalentes.
@@ -103,6 +264,8 @@ def limpiar_estandarizar(df: pd.DataFrame, ciudad: str) -> pd.DataFrame:
     - price normalizado
     - price_per_person
     - amenities_count
+    - es_superhost (booleano canónico a partir de host_is_superhost)
+    - ocupacion_estimada (fracción del año a partir de estimated_occupancy_l365d)
     - identificación d:id y ciudad
     """
     d = df.copy()
@@ -143,6 +306,18 @@ def limpiar_estandarizar(df: pd.DataFrame, ciudad: str) -> pd.DataFrame:
     else:
         d["amenities_count"] = np.nan
 
+    # Bandera de superhost normalizada una sola vez en la ingesta.
+    # Todas las páginas usan esta columna en lugar de procesar el texto en cada rerun.
+    if "host_is_superhost" in d.columns:
+        d["es_superhost"] = _a_booleano(d["host_is_superhost"])
+    else:
+        d["es_superhost"] = False
+
+    # Ocupación y revenue estimados por listing (días ocupados y € en los últimos 365 días)
+    d["estimated_occupancy_l365d"] = pd.to_numeric(d.get("estimated_occupancy_l365d", np.nan), errors="coerce")
+    d["estimated_revenue_l365d"] = pd.to_numeric(d.get("estimated_revenue_l365d", np.nan), errors="coerce")
+    d["ocupacion_estimada"] = (d["estimated_occupancy_l365d"] / 365).clip(0, 1)
+
     d["price_per_person"] = np.where(
         (d["accommodates"] > 0) & d["price"].notna(),
         d["price"] / d["accommodates"],
@@ -163,7 +338,11 @@ def limpiar_estandarizar(df: pd.DataFrame, ciudad: str) -> pd.DataFrame:
         "longitude",
         "number_of_reviews_ltm",
         "review_scores_rating",
-        "host_is_superhost"
+        "host_is_superhost",
+        "es_superhost",
+        "estimated_occupancy_l365d",
+        "estimated_revenue_l365d",
+        "ocupacion_estimada"
     ]
 
     # Si alguna columna no existe, se rellena con NaN para evitar errores
@@ -194,6 +373,79 @@ def recortar_outliers_por_ciudad(df: pd.DataFrame) -> pd.DataFrame:
     return pd.concat(limpio, ignore_index=True)
 
 
+def validar_coordenadas(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Marca los listings con coordenadas fuera de la caja de su ciudad
+    (LIMITES_CIUDADES) o sin coordenadas.
+
+    Se agrega la columna booleana coord_validas y se anulan latitud y
+    longitud de los listings no válidos, de modo que mapas y cálculos
+    espaciales (que descartan coordenadas nulas) los ignoran, mientras
+    que los KPIs siguen contando esos listings. Las ciudades sin caja
+    registrada solo se validan por nulos.
+    """
+    d = df.copy()
+    lat = d["latitude"].to_numpy(dtype=float)
+    lon = d["longitude"].to_numpy(dtype=float)
+
+    limites = pd.DataFrame.from_dict(
+        LIMITES_CIUDADES, orient="index",
+        columns=["lat_min", "lat_max", "lon_min", "lon_max"],
+    ).reindex(d["ciudad"]).to_numpy(dtype=float)
+
+    sin_caja = np.isnan(limites[:, 0])
+    dentro = (
+        (lat >= limites[:, 0]) & (lat <= limites[:, 1])
+        & (lon >= limites[:, 2]) & (lon <= limites[:, 3])
+    )
+    validas = ~(np.isnan(lat) | np.isnan(lon)) & (sin_caja | dentro)
+
+    d["coord_validas"] = validas
+    d["latitude"] = np.where(validas, lat, np.nan)
+    d["longitude"] = np.where(validas, lon, np.nan)
+    return d
+
+
+# Umbrales de la reputación del host (rating y reseñas de los últimos 12 meses):
+# Top host → rating >= top_rating_min y reseñas >= top_reviews_min
+# Riesgoso → rating < riesgo_rating_max o reseñas < riesgo_reviews_max (tiene prioridad)
+# El resto de listings se clasifica como Normal.
+UMBRALES_REPUTACION = {
+    "top_rating_min": 4.8,
+    "top_reviews_min": 30,
+    "riesgo_rating_max": 4.3,
+    "riesgo_reviews_max": 5,
+}
+
+# Categorías de reputación, en el orden en que se muestran
+CATEGORIAS_REPUTACION = ["Top host", "Normal", "Riesgoso"]
+
+
+def clasificar_reputacion(df: pd.DataFrame, umbrales: dict = UMBRALES_REPUTACION) -> pd.DataFrame:
+    """
+    Agrega la columna categórica categoria_reputacion según UMBRALES_REPUTACION.
+
+    La clasificación se hace una sola vez en la ingesta con np.select sobre
+    códigos enteros. Los listings sin rating o sin conteo de reseñas quedan
+    sin categoría (nulo).
+    """
+    d = df.copy()
+    rating = pd.to_numeric(d["review_scores_rating"], errors="coerce").to_numpy(dtype=float)
+    reviews = pd.to_numeric(d["number_of_reviews_ltm"], errors="coerce").to_numpy(dtype=float)
+
+    sin_datos = np.isnan(rating) | np.isnan(reviews)
+    riesgo = (rating < umbrales["riesgo_rating_max"]) | (reviews < umbrales["riesgo_reviews_max"])
+    top = (rating >= umbrales["top_rating_min"]) & (reviews >= umbrales["top_reviews_min"])
+
+    codigos = np.select(
+        [sin_datos, riesgo, top],
+        [-1, CATEGORIAS_REPUTACION.index("Riesgoso"), CATEGORIAS_REPUTACION.index("Top host")],
+        default=CATEGORIAS_REPUTACION.index("Normal"),
+    )
+    d["categoria_reputacion"] = pd.Categorical.from_codes(codigos, CATEGORIAS_REPUTACION)
+    return d
+
+
 @st.cache_data(show_spinner=False)
 def load_data():
     """
@@ -203,6 +455,12 @@ def load_data():
     - Descarga CSV remoto
     - Limpia y estandariza
     - Aplica filtro de extremos
+    - Anula coordenadas fuera de la caja de su ciudad (LIMITES_CIUDADES)
+    - Calcula distancias y conteos de sitios turísticos y hubs de transporte
+    - Clasifica la reputación del host (ver clasificar_reputacion)
+    - Calcula percentiles de precio, rating, reseñas y amenidades dentro
+      de la ciudad y del barrio (ver utils_kpis.agregar_percentiles)
+    - Construye el índice espacial por ciudad (ver utils_espacial.indices_espaciales)
 
     Retorna:
     df_all: DataFrame único consolidado
@@ -230,4 +488,61 @@ def load_data():
 
     df_all = recortar_outliers_por_ciudad(df_all)
 
+    # Coordenadas limpias una sola vez: mapas e índices espaciales las heredan
+    df_all = validar_coordenadas(df_all)
+
+    # Variables de accesibilidad (distancia al POI más cercano y POIs en el radio)
+    df_all = agregar_proximidad(df_all, pois_cargados()["por_tipo"])
+
+    # Reputación del host calculada una vez por versión de datos
+    df_all = clasificar_reputacion(df_all)
+
+    # Posición de cada listing dentro de su ciudad y de su barrio
+    df_all = agregar_percentiles(df_all)
+
+    df_all.attrs["version"] = _calcular_version(df_all)
+
+    # El índice espacial queda en caché de recursos para esta versión de datos
+    indices_espaciales(df_all, df_all.attrs["version"])
+
+    # Igual con las distribuciones ordenadas para consultas de percentil
+    distribuciones_cacheadas(df_all, df_all.attrs["version"])
+
     return df_all, warnings
+
+
+def _calcular_version(df: pd.DataFrame) -> str:
+    """
+    Genera una huella corta del contenido del DataFrame.
+
+    Se calcula una sola vez al cargar los datos y sirve como llave
+    de caché para todos los cálculos derivados, evitando que Streamlit
+    tenga que volver a hashear el DataFrame completo en cada rerun.
+    """
+    hashes = pd.util.hash_pandas_object(df, index=False).values
+    return hashlib.sha1(hashes.tobytes()).hexdigest()[:12]
+
+
+def version_datos(df: pd.DataFrame) -> str:
+    """
+    Devuelve la versión asociada al DataFrame (o a un subconjunto de él).
+
+    Las funciones con @st.cache_data reciben el DataFrame con prefijo "_"
+    (no se hashea) junto con esta versión, que sí forma parte de la llave.
+    """
+    return df.attrs.get("version", "")
+
+
+def filtrar_con_version(df: pd.DataFrame, mascara, *etiquetas) -> pd.DataFrame:
+    """
+    Filtra el DataFrame y marca el subconjunto con una versión derivada.
+
+    pandas copia los attrs al filtrar, por lo que sin este paso un
+    subconjunto heredaría la versión del DataFrame completo y compartiría
+    llave de caché con él. Las etiquetas describen el filtro aplicado
+    (ciudades, barrios, rangos...).
+    """
+    sub = df[mascara].copy()
+    partes = [version_datos(df)] + [str(e) for e in etiquetas]
+    sub.attrs["version"] = "|".join(partes)
+    return sub
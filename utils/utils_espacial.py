@@ -0,0 +1,588 @@
+import numpy as np
+import pandas as pd
+import streamlit as st
+
+
+# Número máximo de listings que se envían como puntos individuales a un mapa.
+# Por encima de este umbral los puntos se agregan en una rejilla.
+UMBRAL_PUNTOS_MAPA = 3000
+
+# Tamaño aproximado (en píxeles de pantalla) de cada celda de la rejilla.
+PIXELES_CELDA = 12
+
+# Ancho aproximado en píxeles de los mapas del dashboard, usado para estimar el zoom.
+ANCHO_MAPA_PX = 700
+
+
+def zoom_ajustado(lat, lon, ancho_px=ANCHO_MAPA_PX):
+    """
+    Estima el nivel de zoom de Mapbox para que quepa la extensión de los puntos.
+
+    Se usan los percentiles 1 y 99 para que unos pocos puntos mal
+    geocodificados no obliguen a alejar el mapa.
+    """
+    lat = np.asarray(lat, dtype=float)
+    lon = np.asarray(lon, dtype=float)
+    if lat.size == 0:
+        return 10.0
+
+    lat_min, lat_max = np.nanpercentile(lat, [1, 99])
+    lon_min, lon_max = np.nanpercentile(lon, [1, 99])
+    coslat = max(np.cos(np.radians((lat_min + lat_max) / 2)), 0.1)
+
+    # Extensión en "grados de longitud equivalentes" para comparar ambos ejes
+    extension = max(lon_max - lon_min, (lat_max - lat_min) / coslat, 1e-4)
+    zoom = np.log2(360 * ancho_px / (256 * extension))
+    return float(np.clip(zoom, 1, 15))
+
+
+def celda_para_zoom(zoom, lat_centro, pixeles=PIXELES_CELDA):
+    """
+    Tamaño de celda en grados (lat, lon) que ocupa unos `pixeles` en pantalla
+    al zoom indicado. La celda de latitud se corrige por cos(lat) para que
+    las celdas sean aproximadamente cuadradas sobre el terreno.
+    """
+    celda_lon = pixeles * 360 / (256 * 2 ** zoom)
+    celda_lat = celda_lon * np.cos(np.radians(lat_centro))
+    return celda_lat, celda_lon
+
+
+def agregar_rejilla(df, celda_lat, celda_lon, valor=None, grupo=None):
+    """
+    Agrupa listings en una rejilla cuadrada usando solo operaciones de NumPy.
+
+    Parámetros
+    ----------
+    df        : DataFrame con columnas latitude y longitude (sin nulos)
+    celda_lat : alto de la celda en grados
+    celda_lon : ancho de la celda en grados
+    valor     : columna numérica opcional a promediar por celda (p. ej. price)
+    grupo     : columna categórica opcional; se genera una rejilla por categoría
+
+    Retorna
+    -------
+    DataFrame con una fila por celda ocupada: [grupo], latitude, longitude
+    (centro de la celda), n y, si se indicó, <valor>_mean.
+    """
+    lat = df["latitude"].to_numpy(dtype=float)
+    lon = df["longitude"].to_numpy(dtype=float)
+
+    iy = np.floor(lat / celda_lat).astype(np.int64)
+    ix = np.floor(lon / celda_lon).astype(np.int64)
+
+    # Código único por celda (y categoría) para agregar con bincount
+    iy0, ix0 = iy.min(), ix.min()
+    ny = iy.max() - iy0 + 1
+    nx = ix.max() - ix0 + 1
+    codigo = (iy - iy0) * nx + (ix - ix0)
+
+    if grupo is not None:
+        cod_grupo, categorias = pd.factorize(df[grupo], use_na_sentinel=False)
+        codigo = cod_grupo.astype(np.int64) * (nx * ny) + codigo
+
+    celdas, inverso = np.unique(codigo, return_inverse=True)
+    n = np.bincount(inverso, minlength=len(celdas))
+
+    local = celdas % (nx * ny)
+    res = pd.DataFrame({
+        "latitude": (local // nx + iy0 + 0.5) * celda_lat,
+        "longitude": (local % nx + ix0 + 0.5) * celda_lon,
+        "n": n,
+    })
+
+    if grupo is not None:
+        res.insert(0, grupo, np.asarray(categorias)[celdas // (nx * ny)])
+
+    if valor is not None:
+        v = pd.to_numeric(df[valor], errors="coerce").to_numpy(dtype=float)
+        validos = ~np.isnan(v)
+        suma = np.bincount(inverso, weights=np.where(validos, v, 0.0), minlength=len(celdas))
+        cuenta = np.bincount(inverso, weights=validos.astype(float), minlength=len(celdas))
+        with np.errstate(invalid="ignore", divide="ignore"):
+            res[f"{valor}_mean"] = np.where(cuenta > 0, suma / cuenta, np.nan)
+
+    return res
+
+
+def _suavizado_gaussiano(matriz, sigma):
+    """
+    Suavizado gaussiano separable expresado como producto de matrices:
+    K_filas @ M @ K_columnas.T, donde K es la matriz de bandas del kernel.
+    sigma se expresa en píxeles del raster; los bordes se rellenan con cero.
+    """
+    def matriz_kernel(n):
+        d = np.arange(n)[:, None] - np.arange(n)[None, :]
+        k = np.exp(-(d ** 2) / (2 * sigma ** 2))
+        k[np.abs(d) > 3 * sigma] = 0
+        return k / np.sqrt(2 * np.pi * sigma ** 2)
+
+    return matriz_kernel(matriz.shape[0]) @ matriz @ matriz_kernel(matriz.shape[1]).T
+
+
+def raster_densidad(lat, lon, resolucion=256, sigma=1.5, percentiles=(0.5, 99.5)):
+    """
+    Calcula un raster de densidad de listings con np.histogram2d.
+
+    La extensión se toma de los percentiles indicados para excluir puntos
+    mal geocodificados, y el raster tiene siempre `resolucion` × `resolucion`
+    celdas, de modo que su tamaño no depende del número de listings.
+
+    Retorna
+    -------
+    (densidad, extension) donde densidad es una matriz con la fila 0 al norte
+    y extension = (lat_min, lat_max, lon_min, lon_max).
+    """
+    lat = np.asarray(lat, dtype=float)
+    lon = np.asarray(lon, dtype=float)
+
+    lat_min, lat_max = np.nanpercentile(lat, percentiles)
+    lon_min, lon_max = np.nanpercentile(lon, percentiles)
+
+    # Margen para que el suavizado no se corte en los bordes
+    margen_lat = max((lat_max - lat_min) * 0.05, 1e-3)
+    margen_lon = max((lon_max - lon_min) * 0.05, 1e-3)
+    extension = (lat_min - margen_lat, lat_max + margen_lat, lon_min - margen_lon, lon_max + margen_lon)
+
+    conteos, _, _ = np.histogram2d(
+        lat,
+        lon,
+        bins=resolucion,
+        range=[extension[:2], extension[2:]],
+    )
+
+    if sigma and sigma > 0:
+        conteos = _suavizado_gaussiano(conteos, sigma)
+
+    # histogram2d ordena la latitud de sur a norte; la imagen va de norte a sur
+    return np.flipud(conteos), extension
+
+
+# Tope de puntos individuales que se envían a un mapa; por encima se muestrea por barrio.
+MAX_PUNTOS_MAPA = 5000
+
+# Decimales de las coordenadas enviadas al navegador (1e-5° ≈ 1 m)
+DECIMALES_COORDENADAS = 5
+
+# Decimales de las variables numéricas mostradas en el hover
+DECIMALES_HOVER = 2
+
+
+def muestreo_estratificado(estratos, max_puntos, semilla=0):
+    """
+    Posiciones (ordenadas) de una muestra de unos max_puntos elementos
+    repartida entre estratos (p. ej. barrios) en proporción a su tamaño,
+    con al menos un elemento por estrato. La semilla fija hace que la
+    muestra sea la misma en cada visita.
+    """
+    codigos, _ = pd.factorize(pd.Series(estratos), use_na_sentinel=False)
+    n = len(codigos)
+    if n <= max_puntos:
+        return np.arange(n)
+
+    tamanos = np.bincount(codigos)
+    cuotas = np.maximum(np.floor(tamanos * max_puntos / n), 1).astype(np.int64)
+
+    # Orden aleatorio dentro de cada estrato y rango de cada elemento en su estrato
+    perm = np.random.default_rng(semilla).permutation(n)
+    orden = perm[np.argsort(codigos[perm], kind="stable")]
+    cod_orden = codigos[orden]
+    inicios = np.concatenate(([0], np.cumsum(tamanos)[:-1]))
+    rango = np.arange(n) - inicios[cod_orden]
+
+    return np.sort(orden[rango < cuotas[cod_orden]])
+
+
+def compactar_columnas(df):
+    """
+    Reduce el tamaño serializado de una tabla de puntos para un mapa:
+        - latitud y longitud redondeadas a DECIMALES_COORDENADAS y en float32,
+        - otras columnas decimales redondeadas a DECIMALES_HOVER y en float32,
+        - columnas de texto como categóricas.
+    """
+    d = df.copy()
+    for col in d.columns:
+        serie = d[col]
+        if col in ("latitude", "longitude"):
+            d[col] = serie.astype(float).round(DECIMALES_COORDENADAS).astype(np.float32)
+        elif pd.api.types.is_float_dtype(serie):
+            d[col] = serie.round(DECIMALES_HOVER).astype(np.float32)
+        elif serie.dtype == object or pd.api.types.is_string_dtype(serie):
+            d[col] = serie.astype("category")
+    return d
+
+
+def preparar_puntos_mapa(df_geo, columnas, estrato="barrio_std", max_puntos=MAX_PUNTOS_MAPA):
+    """
+    Optimizador del payload de un mapa de puntos.
+
+    Conserva solo coordenadas y `columnas` (color y hover), limita el número
+    de puntos a max_puntos con muestreo estratificado por `estrato` y compacta
+    los tipos con compactar_columnas.
+    """
+    cols = ["latitude", "longitude"]
+    for c in columnas:
+        if c and c in df_geo.columns and c not in cols:
+            cols.append(c)
+
+    if len(df_geo) > max_puntos:
+        estratos = df_geo[estrato] if estrato in df_geo.columns else np.zeros(len(df_geo))
+        df_geo = df_geo.iloc[muestreo_estratificado(estratos, max_puntos)]
+
+    return compactar_columnas(df_geo[cols])
+
+
+# Niveles de zoom para los que se guardan geometrías de barrios simplificadas
+ZOOM_GEOMETRIA_MIN = 8
+ZOOM_GEOMETRIA_MAX = 15
+
+
+def nivel_zoom_geometria(zoom):
+    """
+    Nivel de zoom entero (acotado) con el que se indexa la caché de geometrías.
+    """
+    return int(np.clip(np.floor(zoom), ZOOM_GEOMETRIA_MIN, ZOOM_GEOMETRIA_MAX))
+
+
+def tolerancia_para_zoom(zoom, pixeles=1.0):
+    """
+    Tolerancia en grados equivalente a `pixeles` de pantalla en el zoom indicado.
+    A menor zoom, mayor tolerancia y polígonos más simples.
+    """
+    return pixeles * 360.0 / (256 * 2 ** zoom)
+
+
+def douglas_peucker(puntos, tolerancia):
+    """
+    Simplificación de una polilínea con el algoritmo de Douglas–Peucker.
+
+    Se recorre con una pila en lugar de recursión y la distancia de todos
+    los puntos intermedios al segmento se calcula de una vez con NumPy.
+    Si la polilínea es cerrada (primer punto = último) la distancia se mide
+    al punto inicial.
+    """
+    puntos = np.asarray(puntos, dtype=float)
+    n = len(puntos)
+    if n < 3:
+        return puntos
+
+    conservar = np.zeros(n, dtype=bool)
+    conservar[[0, -1]] = True
+    pila = [(0, n - 1)]
+
+    while pila:
+        i, j = pila.pop()
+        if j <= i + 1:
+            continue
+        a = puntos[i]
+        dx, dy = puntos[j] - a
+        tramo = puntos[i + 1:j] - a
+        norma = np.hypot(dx, dy)
+        if norma == 0:
+            dist = np.hypot(tramo[:, 0], tramo[:, 1])
+        else:
+            dist = np.abs(dx * tramo[:, 1] - dy * tramo[:, 0]) / norma
+
+        k = int(np.argmax(dist))
+        if dist[k] > tolerancia:
+            m = i + 1 + k
+            conservar[m] = True
+            pila.append((i, m))
+            pila.append((m, j))
+
+    return puntos[conservar]
+
+
+def simplificar_geometria(geometria, tolerancia):
+    """
+    Simplifica un Polygon o MultiPolygon de GeoJSON anillo por anillo.
+
+    Los anillos exteriores que colapsan (menos de 4 puntos) se conservan sin
+    simplificar; los huecos que colapsan se eliminan. Las coordenadas se
+    redondean a DECIMALES_COORDENADAS.
+    """
+    def anillos(poligono):
+        salida = []
+        for k, anillo in enumerate(poligono):
+            simple = douglas_peucker(anillo, tolerancia)
+            if len(simple) < 4:
+                if k > 0:
+                    continue
+                simple = np.asarray(anillo, dtype=float)
+            salida.append(np.round(simple, DECIMALES_COORDENADAS).tolist())
+        return salida
+
+    if geometria["type"] == "Polygon":
+        return {"type": "Polygon", "coordinates": anillos(geometria["coordinates"])}
+    if geometria["type"] == "MultiPolygon":
+        return {"type": "MultiPolygon", "coordinates": [anillos(p) for p in geometria["coordinates"]]}
+    return geometria
+
+
+RADIO_TIERRA_KM = 6371.0088
+
+# Tamaño de celda (km) del índice espacial por ciudad
+CELDA_INDICE_KM = 0.25
+
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    """
+    Distancia de gran círculo en km, vectorizada con broadcasting de NumPy.
+    Acepta escalares o arreglos de formas compatibles.
+    """
+    lat1, lon1, lat2, lon2 = (np.radians(np.asarray(x, dtype=float)) for x in (lat1, lon1, lat2, lon2))
+    a = (
+        np.sin((lat2 - lat1) / 2) ** 2
+        + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    )
+    return 2 * RADIO_TIERRA_KM * np.arcsin(np.sqrt(np.clip(a, 0, 1)))
+
+
+class IndiceEspacial:
+    """
+    Índice de rejilla uniforme sobre las coordenadas de una ciudad.
+
+    Los puntos se ordenan por código de celda, de modo que los puntos de
+    una fila de celdas contiguas ocupan un rango contiguo del arreglo y se
+    localizan con np.searchsorted. Las consultas devuelven posiciones sobre
+    los arreglos con los que se construyó; `etiquetas[pos]` las traduce a
+    etiquetas del índice del DataFrame original (para usar con .loc).
+    """
+
+    def __init__(self, lat, lon, etiquetas=None, celda_km=CELDA_INDICE_KM):
+        lat = np.asarray(lat, dtype=float)
+        lon = np.asarray(lon, dtype=float)
+        validos = np.flatnonzero(~(np.isnan(lat) | np.isnan(lon)))
+
+        self.lat = lat
+        self.lon = lon
+        self.etiquetas = np.arange(len(lat)) if etiquetas is None else np.asarray(etiquetas)
+        lat_ref = np.nanmedian(lat) if validos.size else 0.0
+        self.celda_lat = celda_km / 111.32
+        self.celda_lon = celda_km / (111.32 * max(np.cos(np.radians(lat_ref)), 0.1))
+
+        iy = np.floor(lat[validos] / self.celda_lat).astype(np.int64)
+        ix = np.floor(lon[validos] / self.celda_lon).astype(np.int64)
+        self.iy0 = int(iy.min()) if validos.size else 0
+        self.ix0 = int(ix.min()) if validos.size else 0
+        self.ny = int(iy.max()) - self.iy0 + 1 if validos.size else 0
+        self.nx = int(ix.max()) - self.ix0 + 1 if validos.size else 0
+
+        codigos = (iy - self.iy0) * self.nx + (ix - self.ix0)
+        orden = np.argsort(codigos, kind="stable")
+        self.codigos = codigos[orden]
+        self.posiciones = validos[orden]
+
+    def __len__(self):
+        return len(self.posiciones)
+
+    def _candidatos(self, lat_min, lat_max, lon_min, lon_max):
+        """
+        Posiciones de los puntos en las celdas que tocan el rectángulo.
+        """
+        if not len(self):
+            return np.empty(0, dtype=np.int64)
+
+        y0 = max(int(np.floor(lat_min / self.celda_lat)) - self.iy0, 0)
+        y1 = min(int(np.floor(lat_max / self.celda_lat)) - self.iy0, self.ny - 1)
+        x0 = max(int(np.floor(lon_min / self.celda_lon)) - self.ix0, 0)
+        x1 = min(int(np.floor(lon_max / self.celda_lon)) - self.ix0, self.nx - 1)
+        if y0 > y1 or x0 > x1:
+            return np.empty(0, dtype=np.int64)
+
+        # Cada fila de celdas es un rango contiguo de códigos
+        filas = np.arange(y0, y1 + 1) * self.nx
+        inicios = np.searchsorted(self.codigos, filas + x0, side="left")
+        fines = np.searchsorted(self.codigos, filas + x1, side="right")
+        return np.concatenate([self.posiciones[i:f] for i, f in zip(inicios, fines)])
+
+    def en_rectangulo(self, lat_min, lat_max, lon_min, lon_max):
+        """
+        Posiciones de los puntos dentro del rectángulo (por ejemplo, la vista del mapa).
+        """
+        cand = self._candidatos(lat_min, lat_max, lon_min, lon_max)
+        dentro = (
+            (self.lat[cand] >= lat_min) & (self.lat[cand] <= lat_max)
+            & (self.lon[cand] >= lon_min) & (self.lon[cand] <= lon_max)
+        )
+        return cand[dentro]
+
+    def en_radio(self, lat, lon, radio_km):
+        """
+        Posiciones y distancias (km) de los puntos a menos de radio_km de (lat, lon),
+        ordenadas de la más cercana a la más lejana.
+        """
+        # La amplitud en longitud se toma en la latitud más cercana al polo
+        # que alcanza el rectángulo, para no dejar fuera puntos del círculo
+        d_lat = radio_km / 111.32
+        d_lon = radio_km / (111.32 * max(np.cos(np.radians(min(abs(lat) + d_lat, 90.0))), 0.1))
+        cand = self._candidatos(lat - d_lat, lat + d_lat, lon - d_lon, lon + d_lon)
+
+        dist = haversine_km(lat, lon, self.lat[cand], self.lon[cand])
+        dentro = dist <= radio_km
+        cand, dist = cand[dentro], dist[dentro]
+        orden = np.argsort(dist, kind="stable")
+        return cand[orden], dist[orden]
+
+    def _alcance_km(self, lat, lon):
+        """
+        Distancia (km) de (lat, lon) a la esquina más lejana de la rejilla.
+        """
+        lats = np.array([self.iy0, self.iy0 + self.ny]) * self.celda_lat
+        lons = np.array([self.ix0, self.ix0 + self.nx]) * self.celda_lon
+        return float(haversine_km(lat, lon, np.repeat(lats, 2), np.tile(lons, 2)).max())
+
+    def vecinos(self, lat, lon, k=10):
+        """
+        Los k puntos más cercanos a (lat, lon): posiciones y distancias en km.
+
+        Se busca en un radio que se duplica hasta contener al menos k puntos;
+        en ese momento los k más cercanos están necesariamente dentro del radio.
+        Si el radio llega a cubrir la esquina más lejana de la rejilla (consulta
+        lejos de la ciudad) se calcula la distancia a todos los puntos.
+        """
+        k = min(k, len(self))
+        if k <= 0:
+            return np.empty(0, dtype=np.int64), np.empty(0)
+
+        radio = CELDA_INDICE_KM
+        alcance = self._alcance_km(lat, lon)
+        while radio < alcance:
+            pos, dist = self.en_radio(lat, lon, radio)
+            if len(pos) >= k:
+                return pos[:k], dist[:k]
+            radio *= 2
+
+        dist = haversine_km(lat, lon, self.lat[self.posiciones], self.lon[self.posiciones])
+        orden = np.argsort(dist, kind="stable")[:k]
+        return self.posiciones[orden], dist[orden]
+
+
+def construir_indices(df):
+    """
+    Construye un IndiceEspacial por ciudad.
+
+    Las posiciones de cada índice se refieren al subconjunto de la ciudad,
+    y sus etiquetas al índice de df.
+    """
+    return {
+        ciudad: IndiceEspacial(grupo["latitude"], grupo["longitude"], grupo.index.to_numpy())
+        for ciudad, grupo in df.groupby("ciudad", sort=False)
+    }
+
+
+@st.cache_resource(show_spinner=False)
+def indices_espaciales(_df, version):
+    """
+    Índices espaciales por ciudad, construidos una vez por versión de datos
+    y compartidos entre sesiones (no se copian en cada acceso).
+    """
+    return construir_indices(_df)
+
+
+# Radio (km) para contar sitios turísticos y hubs de transporte cercanos a cada listing
+RADIO_PROXIMIDAD_KM = 1.0
+
+# Margen (km) con el que se preseleccionan POIs alrededor de los listings de una ciudad
+MARGEN_POIS_KM = 5.0
+
+# Máximo de pares listing × POI evaluados por lote (controla la memoria)
+PARES_POR_LOTE = 2_000_000
+
+
+def _distancias_por_lotes(lat, lon, poi_lat, poi_lon, radio_km):
+    """
+    Distancia al POI más cercano y número de POIs dentro de radio_km
+    para cada punto, evaluando la haversine en lotes con broadcasting.
+    """
+    n = len(lat)
+    minimo = np.full(n, np.inf)
+    conteo = np.zeros(n, dtype=np.int32)
+    if len(poi_lat) == 0:
+        return minimo, conteo
+
+    lote = max(PARES_POR_LOTE // len(poi_lat), 1)
+    for inicio in range(0, n, lote):
+        fin = min(inicio + lote, n)
+        d = haversine_km(
+            lat[inicio:fin, None], lon[inicio:fin, None],
+            poi_lat[None, :], poi_lon[None, :],
+        )
+        minimo[inicio:fin] = d.min(axis=1)
+        conteo[inicio:fin] = (d <= radio_km).sum(axis=1)
+    return minimo, conteo
+
+
+def proximidad_pois(lat, lon, poi_lat, poi_lon, radio_km=RADIO_PROXIMIDAD_KM):
+    """
+    Distancia (km) al POI más cercano y conteo de POIs a menos de radio_km.
+
+    Los POIs se indexan con IndiceEspacial y solo se evalúan los que caen
+    en la extensión de los puntos ampliada MARGEN_POIS_KM. Los pocos puntos
+    cuyo POI más cercano queda fuera de ese margen se recalculan contra
+    todos los POIs, por lo que el resultado es exacto.
+    """
+    lat = np.asarray(lat, dtype=float)
+    lon = np.asarray(lon, dtype=float)
+    poi_lat = np.asarray(poi_lat, dtype=float)
+    poi_lon = np.asarray(poi_lon, dtype=float)
+
+    minimo = np.full(len(lat), np.nan)
+    conteo = np.zeros(len(lat), dtype=np.int32)
+    validos = ~(np.isnan(lat) | np.isnan(lon))
+    if not validos.any() or len(poi_lat) == 0:
+        return minimo, conteo
+
+    lat_v, lon_v = lat[validos], lon[validos]
+    margen_lat = MARGEN_POIS_KM / 111.32
+    margen_lon = MARGEN_POIS_KM / (111.32 * max(np.cos(np.radians(np.median(lat_v))), 0.1))
+
+    indice = IndiceEspacial(poi_lat, poi_lon)
+    cerca = indice.en_rectangulo(
+        lat_v.min() - margen_lat, lat_v.max() + margen_lat,
+        lon_v.min() - margen_lon, lon_v.max() + margen_lon,
+    )
+
+    d_min, n_radio = _distancias_por_lotes(lat_v, lon_v, poi_lat[cerca], poi_lon[cerca], radio_km)
+
+    # Puntos sin POI preseleccionado a menos del margen: se comparan contra todos
+    lejos = d_min > MARGEN_POIS_KM
+    if lejos.any():
+        d_min[lejos], _ = _distancias_por_lotes(lat_v[lejos], lon_v[lejos], poi_lat, poi_lon, radio_km)
+
+    minimo[validos] = d_min
+    conteo[validos] = n_radio
+    return minimo, conteo
+
+
+def agregar_proximidad(df, pois_por_tipo, radio_km=RADIO_PROXIMIDAD_KM):
+    """
+    Agrega al DataFrame de listings las columnas de accesibilidad:
+        dist_turismo_km, turismo_cercanos       → sitios turísticos
+        dist_transporte_km, transporte_cercanos → hubs de transporte
+    pois_por_tipo es el diccionario tipo → DataFrame de utils_datos.pois_cargados.
+    Los conteos se refieren a radio_km. Si no hay POIs, las distancias quedan en NaN.
+    """
+    d = df.copy()
+    tipos = {
+        "turismo": "Tourist Spot",
+        "transporte": "Transport Hub",
+    }
+
+    for nombre, tipo in tipos.items():
+        sub = pois_por_tipo.get(tipo)
+        dist = np.full(len(d), np.nan)
+        cuenta = np.zeros(len(d), dtype=np.int32)
+
+        if sub is not None and not sub.empty:
+            # Cálculo por ciudad para que la preselección de POIs sea local
+            for _, grupo in d.groupby("ciudad", sort=False):
+                pos = d.index.get_indexer(grupo.index)
+                dist[pos], cuenta[pos] = proximidad_pois(
+                    grupo["latitude"], grupo["longitude"],
+                    sub["Latitude"], sub["Longitude"], radio_km,
+                )
+
+        d[f"dist_{nombre}_km"] = dist.astype(np.float32)
+        d[f"{nombre}_cercanos"] = cuenta
+
+    return d
@@ -0,0 +1,252 @@
+from itertools import combinations
+
+import numpy as np
+import pandas as pd
+import streamlit as st
+
+from utils.utils_espacial import compactar_columnas
+
+
+# Categorías por eje que se muestran en las tablas de coocurrencia;
+# el resto se acumula en la categoría ETIQUETA_OTROS
+TOP_COOCURRENCIAS = 15
+
+# Etiquetas de la categoría agregada y de los valores nulos
+ETIQUETA_OTROS = "Otros"
+ETIQUETA_NA = "NA"
+
+
+def codificar_top_k(serie: pd.Series, top_k: int, agrupar_otros: bool = True):
+    """
+    Convierte una columna categórica en códigos enteros ordenados por frecuencia.
+
+    Se factoriza una sola vez (sin convertir a texto) y se cuenta con np.bincount.
+    Las top_k categorías más frecuentes conservan códigos 0..top_k-1; el resto
+    recibe el código top_k (categoría "Otros") o -1 si agrupar_otros es False.
+    Los nulos se tratan como la categoría "NA".
+
+    Retorna
+    -------
+    (codigos, etiquetas): array int64 del largo de la serie y lista de etiquetas
+    de texto, una por código válido.
+    """
+    codigos, categorias = pd.factorize(serie, use_na_sentinel=False)
+    etiquetas = [ETIQUETA_NA if pd.isna(c) else str(c) for c in categorias]
+
+    conteos = np.bincount(codigos, minlength=len(categorias))
+    orden = np.argsort(-conteos, kind="stable")
+    top = orden[:top_k]
+
+    # Tabla de traducción código original → código por frecuencia
+    resto = top_k if agrupar_otros else -1
+    traduccion = np.full(len(categorias), resto, dtype=np.int64)
+    traduccion[top] = np.arange(len(top))
+
+    etiquetas_top = [etiquetas[i] for i in top]
+    if agrupar_otros and len(orden) > top_k:
+        etiquetas_top.append(ETIQUETA_OTROS)
+
+    return traduccion[codigos], etiquetas_top
+
+
+def matriz_coocurrencias(codigos_x, n_x, codigos_y, n_y) -> np.ndarray:
+    """
+    Cuenta todas las combinaciones de dos variables codificadas en una pasada:
+    np.bincount sobre code_x * n_y + code_y. Las filas con algún código
+    negativo (categorías descartadas) no se cuentan.
+
+    Retorna una matriz (n_y, n_x) lista para un heatmap.
+    """
+    validos = (codigos_x >= 0) & (codigos_y >= 0)
+    plano = codigos_x[validos] * n_y + codigos_y[validos]
+    return np.bincount(plano, minlength=n_x * n_y).reshape(n_x, n_y).T
+
+
+def tablas_coocurrencia(df: pd.DataFrame, columnas, top_k: int = TOP_COOCURRENCIAS) -> dict:
+    """
+    Precalcula las tablas de coocurrencia de todos los pares de columnas.
+
+    Cada columna se codifica una sola vez; cada par es después un bincount
+    sobre enteros. Solo se guarda un orden por par (x, y): el par inverso
+    es la transpuesta (ver coocurrencias_de).
+
+    Retorna
+    -------
+    dict (cat_x, cat_y) → DataFrame de conteos con las etiquetas de cat_y
+    como índice y las de cat_x como columnas.
+    """
+    columnas = [c for c in columnas if c in df.columns]
+    codigos = {c: codificar_top_k(df[c], top_k) for c in columnas}
+
+    tablas = {}
+    for cx, cy in combinations(columnas, 2):
+        (codigos_x, etiquetas_x), (codigos_y, etiquetas_y) = codigos[cx], codigos[cy]
+        matriz = matriz_coocurrencias(codigos_x, len(etiquetas_x), codigos_y, len(etiquetas_y))
+        tablas[(cx, cy)] = pd.DataFrame(matriz, index=etiquetas_y, columns=etiquetas_x)
+
+    return tablas
+
+
+@st.cache_data(show_spinner=False)
+def coocurrencias_cacheadas(_df: pd.DataFrame, version: str, columnas: tuple, top_k: int = TOP_COOCURRENCIAS) -> dict:
+    """
+    Versión cacheada de tablas_coocurrencia: una entrada por versión de datos
+    (p. ej. una ciudad) y lista de columnas. Cambiar de ejes ya no recalcula nada.
+    """
+    return tablas_coocurrencia(_df, list(columnas), top_k)
+
+
+def coocurrencias_de(tablas: dict, cat_x: str, cat_y: str) -> pd.DataFrame:
+    """
+    Devuelve la tabla (índice cat_y, columnas cat_x) de un par en cualquier orden.
+    """
+    if (cat_x, cat_y) in tablas:
+        return tablas[(cat_x, cat_y)]
+    return tablas[(cat_y, cat_x)].T
+
+
+# Máximo de valores atípicos por categoría que se envían al navegador
+MAX_ATIPICOS_CAJA = 30
+
+# Factor del rango intercuartílico que define los bigotes (criterio de Tukey)
+FACTOR_IQR = 1.5
+
+
+def resumen_cajas(
+    df: pd.DataFrame,
+    categoria: str,
+    valor: str,
+    top_n: int,
+    max_atipicos: int = MAX_ATIPICOS_CAJA,
+    semilla: int = 0,
+):
+    """
+    Estadísticos de boxplot de `valor` para las top_n categorías más frecuentes.
+
+    Los cuartiles salen de una sola pasada agrupada por códigos de categoría;
+    los bigotes son el menor y el mayor valor dentro de
+    [q1 - 1.5·IQR, q3 + 1.5·IQR], como en Plotly. De los valores fuera de
+    ese rango se conserva una muestra de a lo más max_atipicos por categoría.
+
+    Retorna
+    -------
+    (resumen, atipicos): resumen con categoria, n, q1, mediana, q3,
+    bigote_inf y bigote_sup (una fila por categoría, ordenadas por frecuencia);
+    atipicos con categoria y valor.
+    """
+    datos = df[[categoria, valor]].dropna()
+    codigos, etiquetas = codificar_top_k(datos[categoria], top_n, agrupar_otros=False)
+    validos = codigos >= 0
+    codigos = codigos[validos]
+    valores = datos[valor].to_numpy(dtype=float)[validos]
+
+    if not len(valores):
+        return (
+            pd.DataFrame(columns=["categoria", "n", "q1", "mediana", "q3", "bigote_inf", "bigote_sup"]),
+            pd.DataFrame(columns=["categoria", "valor"]),
+        )
+
+    g = pd.Series(valores).groupby(codigos)
+    cuartiles = g.quantile([0.25, 0.5, 0.75]).unstack()
+    q1, mediana, q3 = (cuartiles[q].to_numpy() for q in (0.25, 0.5, 0.75))
+
+    iqr = q3 - q1
+    lim_inf = (q1 - FACTOR_IQR * iqr)[codigos]
+    lim_sup = (q3 + FACTOR_IQR * iqr)[codigos]
+    dentro = (valores >= lim_inf) & (valores <= lim_sup)
+
+    internos = pd.Series(valores[dentro]).groupby(codigos[dentro])
+    resumen = pd.DataFrame({
+        "categoria": [etiquetas[c] for c in cuartiles.index],
+        "n": g.size().to_numpy(),
+        "q1": q1,
+        "mediana": mediana,
+        "q3": q3,
+        "bigote_inf": internos.min().reindex(cuartiles.index).to_numpy(),
+        "bigote_sup": internos.max().reindex(cuartiles.index).to_numpy(),
+    })
+
+    # Muestra acotada de atípicos: orden aleatorio reproducible y corte por categoría
+    fuera = np.flatnonzero(~dentro)
+    fuera = fuera[np.random.default_rng(semilla).permutation(len(fuera))]
+    muestra = pd.DataFrame({"codigo": codigos[fuera], "valor": valores[fuera]})
+    muestra = muestra[muestra.groupby("codigo").cumcount() < max_atipicos].sort_values("codigo")
+    atipicos = pd.DataFrame({
+        "categoria": [etiquetas[c] for c in muestra["codigo"]],
+        "valor": muestra["valor"].to_numpy(),
+    })
+
+    return resumen, atipicos
+
+
+# Máximo de puntos de un diagrama de dispersión enviados al navegador
+MAX_PUNTOS_DISPERSION = 4000
+
+# Celdas por eje de la rejilla usada para muestrear los diagramas de dispersión
+CELDAS_DISPERSION = 40
+
+
+def _eje_a_celdas(valores, celdas):
+    """
+    Índice de celda (0..celdas-1) de cada valor en una rejilla uniforme entre su mínimo y máximo.
+    """
+    minimo, maximo = valores.min(), valores.max()
+    ancho = (maximo - minimo) / celdas if maximo > minimo else 1.0
+    return np.clip(((valores - minimo) / ancho).astype(np.int64), 0, celdas - 1)
+
+
+def muestreo_por_celdas(x, y, max_puntos, celdas=CELDAS_DISPERSION, semilla=0):
+    """
+    Posiciones (ordenadas) de una muestra de a lo más max_puntos puntos (x, y)
+    que conserva la forma de la nube.
+
+    El plano se divide en una rejilla de celdas × celdas y cada celda aporta
+    como máximo k puntos, con k el mayor cupo que cabe en max_puntos. Las
+    celdas poco pobladas (colas, atípicos) se conservan completas y solo se
+    recortan las zonas densas, donde los puntos se solapan de todos modos.
+    """
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    n = len(x)
+    if n <= max_puntos:
+        return np.arange(n)
+
+    codigos = _eje_a_celdas(x, celdas) * celdas + _eje_a_celdas(y, celdas)
+    codigos = np.unique(codigos, return_inverse=True)[1]
+    tamanos = np.bincount(codigos)
+
+    # Búsqueda binaria del mayor cupo k con sum(min(tamaño, k)) <= max_puntos
+    bajo, alto = 1, int(tamanos.max())
+    while bajo < alto:
+        medio = (bajo + alto + 1) // 2
+        if np.minimum(tamanos, medio).sum() <= max_puntos:
+            bajo = medio
+        else:
+            alto = medio - 1
+
+    # Orden aleatorio dentro de cada celda y rango de cada punto en su celda
+    perm = np.random.default_rng(semilla).permutation(n)
+    orden = perm[np.argsort(codigos[perm], kind="stable")]
+    inicios = np.concatenate(([0], np.cumsum(tamanos)[:-1]))
+    rango = np.arange(n) - inicios[codigos[orden]]
+
+    return np.sort(orden[rango < bajo])
+
+
+def preparar_puntos_dispersion(df, x, y, columnas=(), max_puntos=MAX_PUNTOS_DISPERSION):
+    """
+    Optimizador del payload de un diagrama de dispersión.
+
+    Descarta filas sin x o y, conserva solo x, y y `columnas` (color, tamaño),
+    limita los puntos con muestreo_por_celdas y compacta los tipos con
+    compactar_columnas. Con el resultado se dibuja en modo WebGL
+    (px.scatter(..., render_mode="webgl")), de modo que el costo en el
+    navegador no crece con el tamaño de la ciudad.
+    """
+    cols = [x, y] + [c for c in columnas if c and c in df.columns and c not in (x, y)]
+    datos = df[cols].dropna(subset=[x, y])
+
+    if len(datos) > max_puntos:
+        datos = datos.iloc[muestreo_por_celdas(datos[x], datos[y], max_puntos)]
+
+    return compactar_columnas(datos)
@@ -0,0 +1,127 @@
+import json
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import streamlit as st
+
+
+# Presupuesto aproximado (en bytes estimados de datos, ver _tamano_estimado) de
+# la caché de figuras. Al superarse se descartan las figuras usadas hace más
+# tiempo (LRU). No es un límite exacto de memoria: el objeto Figure ocupa más
+# que sus datos, pero el tamaño de los arreglos domina y crece con ellos.
+PRESUPUESTO_BYTES_FIGURAS = 64 * 1024 * 1024
+
+# Bytes estimados por elemento de una lista o de un arreglo de objetos Python
+BYTES_POR_OBJETO = 32
+
+
+def _tamano_estimado(valor):
+    """
+    Tamaño aproximado en bytes de los datos de una figura, sin serializarla:
+    nbytes de los arreglos NumPy, largo de los textos y BYTES_POR_OBJETO
+    por elemento de listas y arreglos de objetos. Recorre diccionarios y
+    listas de diccionarios (trazas, marker, layout).
+    """
+    if isinstance(valor, np.ndarray):
+        return valor.size * BYTES_POR_OBJETO if valor.dtype == object else valor.nbytes
+    if isinstance(valor, str):
+        return len(valor)
+    if isinstance(valor, dict):
+        return sum(_tamano_estimado(v) for v in valor.values())
+    if isinstance(valor, (list, tuple)):
+        if valor and isinstance(valor[0], (dict, list, tuple, np.ndarray)):
+            return sum(_tamano_estimado(v) for v in valor)
+        return len(valor) * BYTES_POR_OBJETO
+    return 8
+
+
+@st.cache_resource
+def _almacen_figuras():
+    """
+    Almacén compartido entre sesiones con las figuras ya construidas.
+
+    Se guarda la figura validada de Plotly y no su JSON: reconstruir una
+    figura desde JSON vuelve a pasar por la validación de Plotly y resulta
+    más lento que construirla con Plotly Express. El tamaño de cada figura
+    se estima una sola vez al insertar (_tamano_estimado) y se usa para
+    respetar PRESUPUESTO_BYTES_FIGURAS.
+    """
+    return {
+        "figuras": OrderedDict(),   # llave → (figura, bytes estimados)
+        "bytes": 0,
+        "hits": 0,
+        "misses": 0,
+        "descartes": 0,
+        "lock": threading.Lock(),
+    }
+
+
+def _llave(chart_id, version, params):
+    """
+    Llave estable a partir del id de la gráfica, la versión de datos y los parámetros.
+    """
+    return (chart_id, version, json.dumps(params or {}, sort_keys=True, default=str))
+
+
+def figura_cacheada(chart_id, version, params, construir):
+    """
+    Devuelve la figura asociada a (versión de datos, id de gráfica, parámetros).
+
+    Si no está en caché, se llama a construir() —que debe devolver la figura
+    final, con todos sus ajustes de layout— y se guarda el resultado.
+    La figura devuelta es compartida: no debe modificarse después.
+
+    Parámetros
+    ----------
+    chart_id : identificador único de la gráfica (p. ej. "pagina1/precio_ciudad")
+    version  : versión de los datos (utils_datos.version_datos)
+    params   : diccionario con los parámetros que cambian la figura
+    construir: función sin argumentos que crea la figura
+    """
+    almacen = _almacen_figuras()
+    llave = _llave(chart_id, version, params)
+
+    with almacen["lock"]:
+        entrada = almacen["figuras"].get(llave)
+        if entrada is not None:
+            almacen["figuras"].move_to_end(llave)
+            almacen["hits"] += 1
+            return entrada[0]
+        almacen["misses"] += 1
+
+    fig = construir()
+
+    # Estimación sin serializar: st.plotly_chart ya convierte la figura a JSON.
+    # _data y _layout son los diccionarios ya validados que guarda Plotly.
+    tam = _tamano_estimado(fig._data) + _tamano_estimado(fig._layout)
+
+    with almacen["lock"]:
+        if llave not in almacen["figuras"] and tam <= PRESUPUESTO_BYTES_FIGURAS:
+            almacen["figuras"][llave] = (fig, tam)
+            almacen["bytes"] += tam
+            while almacen["bytes"] > PRESUPUESTO_BYTES_FIGURAS:
+                _, (_, tam_viejo) = almacen["figuras"].popitem(last=False)
+                almacen["bytes"] -= tam_viejo
+                almacen["descartes"] += 1
+
+    return fig
+
+
+def metricas_figuras():
+    """
+    Métricas de la caché de figuras: aciertos, fallos, tasa de acierto,
+    figuras almacenadas, tamaño estimado (MB aproximados) y figuras
+    descartadas por el presupuesto.
+    """
+    almacen = _almacen_figuras()
+    with almacen["lock"]:
+        total = almacen["hits"] + almacen["misses"]
+        return {
+            "hits": almacen["hits"],
+            "misses": almacen["misses"],
+            "hit_rate": almacen["hits"] / total if total else 0.0,
+            "figuras": len(almacen["figuras"]),
+            "mb": almacen["bytes"] / 1e6,
+            "descartes": almacen["descartes"],
+        }
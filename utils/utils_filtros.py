@@ -1,6 +1,8 @@
 import streamlit as st
 import pandas as pd
 
+from utils.utils_datos import filtrar_con_version
+
 
 # Esta función genera filtros interactivos basados en ciudad, barrios y rango de precios.
 # Se diseñó para integrarse dentro de una interfaz de Streamlit y facilitar el filtrado estructurado
@@ -30,8 +32,10 @@ def filtros_ciudad_barrios_precios(
     # Selectbox que permite elegir una ciudad de forma única
     ciudad_sel = container.selectbox("Ciudad", ciudades)
 
-    # Se construye un subconjunto del DataFrame únicamente con los registros de la ciudad seleccionada
-    df_city = df[df["ciudad"] == ciudad_sel].copy()
+    # Se construye un subconjunto del DataFrame únicamente con los registros de la ciudad seleccionada.
+    # La máscara acumula los filtros para construir al final el subconjunto con su propia versión.
+    mascara = df["ciudad"] == ciudad_sel
+    df_city = df[mascara]
 
     barrios_sel = []
     # Validación para saber si existe la columna de barrios estandarizados
@@ -57,7 +61,8 @@ def filtros_ciudad_barrios_precios(
 
         # Se filtra nuevamente el dataset si el usuario seleccionó barrios
         if barrios_sel:
-            df_city = df_city[df_city["barrio_std"].isin(barrios_sel)]
+            mascara &= df["barrio_std"].isin(barrios_sel)
+            df_city = df[mascara]
     else:
         # Mensaje informativo cuando no se puede filtrar por barrio
         container.info("No existe la columna 'barrio_std' para filtrar por barrio.")
@@ -77,13 +82,14 @@ def filtros_ciudad_barrios_precios(
         )
 
         # Segmenta el dataframe de acuerdo con el rango seleccionado
-        df_city = df_city[
-            (df_city["price"] >= rango_precios[0]) &
-            (df_city["price"] <= rango_precios[1])
-        ]
+        mascara &= (df["price"] >= rango_precios[0]) & (df["price"] <= rango_precios[1])
     else:
         container.info("No hay datos suficientes de 'price' para filtrar por rango.")
 
+    # Subconjunto final marcado con una versión derivada de los filtros, para que
+    # los cálculos cacheados por versión no lo confundan con el dataset completo
+    df_city = filtrar_con_version(df, mascara, ciudad_sel, barrios_sel, rango_precios)
+
     # La función devuelve la ciudad seleccionada, los barrios seleccionados,
     # el rango seleccionado y el DataFrame filtrado final
     return ciudad_sel, barrios_sel, rango_precios, df_city
@@ -120,8 +126,11 @@ def sidebar_filtros(df, Lista):
         st.info("Selecciona al menos una ciudad.")
         st.stop()
 
-    # Filtra el DataFrame con base en las ciudades seleccionadas
-    df_filtered = df[df["ciudad"].isin(selected_cities)].copy()
+    # Filtra el DataFrame con base en las ciudades seleccionadas.
+    # El subconjunto queda marcado con una versión propia para usarlo como llave de caché.
+    df_filtered = filtrar_con_version(
+        df, df["ciudad"].isin(selected_cities), ",".join(selected_cities)
+    )
 
     # Slider para determinar un top de categorías que se utilizará posteriormente
     top_k = st.sidebar.slider("Top categorías", 5, 30, 10)
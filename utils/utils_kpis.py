@@ -0,0 +1,331 @@
+import numpy as np
+import pandas as pd
+import streamlit as st
+
+
+# Columnas que definen el nivel más fino de agregación.
+# Todos los demás niveles se obtienen sumando sobre esta tabla base.
+CLAVES_BASE = ["ciudad", "barrio_std", "room_type", "accommodates"]
+
+# Niveles de agrupación disponibles en el motor de KPIs.
+# Cada llave es el nombre del nivel y cada valor las columnas que lo definen.
+NIVELES = {
+    "global": [],
+    "ciudad": ["ciudad"],
+    "ciudad_capacidad": ["ciudad", "accommodates"],
+    "ciudad_barrio": ["ciudad", "barrio_std"],
+    "ciudad_room_type": ["ciudad", "room_type"],
+    "capacidad": ["accommodates"],
+    "room_type": ["room_type"],
+}
+
+# Métricas promediadas: columna original → nombre del promedio en el resultado
+METRICAS_MEDIA = {
+    "price": "price_mean",
+    "review_scores_rating": "rating_mean",
+    "price_per_person": "ppp_mean",
+    "number_of_reviews_ltm": "reviews_mean",
+    "amenities_count": "amenities_mean",
+    "dist_turismo_km": "dist_turismo_mean",
+    "dist_transporte_km": "dist_transporte_mean",
+}
+
+
+def _tabla_base(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Única pasada sobre los listings.
+
+    Para cada combinación ciudad × barrio × room_type × capacidad se acumulan
+    sumas y conteos de valores no nulos. Al ser sumas, estos parciales se
+    pueden volver a agregar a cualquier nivel superior sin tocar las filas.
+    """
+    valores = {"listings": np.ones(len(df), dtype=np.int64)}
+
+    for col in METRICAS_MEDIA:
+        serie = pd.to_numeric(df[col], errors="coerce") if col in df.columns else pd.Series(np.nan, index=df.index)
+        valores[f"{col}__suma"] = serie.fillna(0).to_numpy(dtype=float)
+        valores[f"{col}__n"] = serie.notna().to_numpy(dtype=np.int64)
+
+    # Bandera booleana normalizada en la ingesta (utils_datos.limpiar_estandarizar)
+    if "es_superhost" in df.columns:
+        valores["superhost__suma"] = df["es_superhost"].to_numpy(dtype=np.int64)
+    else:
+        valores["superhost__suma"] = np.zeros(len(df), dtype=np.int64)
+
+    tmp = pd.DataFrame(valores, index=df.index)
+    claves = [c for c in CLAVES_BASE if c in df.columns]
+    for c in claves:
+        tmp[c] = df[c].to_numpy()
+
+    if not claves:
+        return tmp.sum().to_frame().T
+
+    return tmp.groupby(claves, dropna=False, sort=False).sum().reset_index()
+
+
+def _resumir(base: pd.DataFrame, columnas: list) -> pd.DataFrame:
+    """
+    Reagrega la tabla base al nivel indicado y convierte sumas en promedios.
+    Los grupos con clave nula se descartan, igual que en un groupby normal.
+    """
+    sumas = [c for c in base.columns if c == "listings" or "__" in c]
+
+    if columnas:
+        if not set(columnas).issubset(base.columns):
+            return pd.DataFrame(columns=columnas + ["listings"])
+        agr = base.groupby(columnas, dropna=True)[sumas].sum().reset_index()
+    else:
+        agr = base[sumas].sum().to_frame().T
+
+    res = agr[columnas + ["listings"]].copy()
+    for col, nombre in METRICAS_MEDIA.items():
+        n = agr[f"{col}__n"]
+        res[nombre] = (agr[f"{col}__suma"] / n).where(n > 0)
+
+    res["pct_superhost"] = 100 * agr["superhost__suma"] / agr["listings"]
+    return res
+
+
+def calcular_kpis(df: pd.DataFrame) -> dict:
+    """
+    Motor de KPIs: calcula listings, precio medio, rating medio, precio por
+    persona, reseñas, amenidades y % de superhosts para todos los niveles
+    definidos en NIVELES.
+
+    Solo se recorre el DataFrame una vez (tabla base); cada nivel se obtiene
+    a partir de esa tabla, cuyo tamaño depende del número de combinaciones
+    y no del número de listings.
+
+    Retorna
+    -------
+    dict nivel → DataFrame con las columnas del nivel y las métricas.
+    """
+    base = _tabla_base(df)
+    return {nivel: _resumir(base, columnas) for nivel, columnas in NIVELES.items()}
+
+
+@st.cache_data(show_spinner=False)
+def kpis_cacheados(_df: pd.DataFrame, version: str) -> dict:
+    """
+    Versión cacheada de calcular_kpis.
+
+    El DataFrame no se hashea; la llave es la versión de los datos
+    (ver utils_datos.version_datos), por lo que el cálculo se realiza
+    una vez por conjunto de datos o subconjunto filtrado.
+    """
+    return calcular_kpis(_df)
+
+
+def kpis_ciudad(kpis: dict, nivel: str, ciudad: str) -> pd.DataFrame:
+    """
+    Extrae las filas de una ciudad de un nivel que incluya la columna 'ciudad'.
+    """
+    tabla = kpis[nivel]
+    return tabla[tabla["ciudad"] == ciudad].drop(columns="ciudad").reset_index(drop=True)
+
+
+# Listings mínimos de un grupo para que su tasa se considere informativa
+MIN_SOPORTE = 20
+
+
+def tasas_por_grupo(df: pd.DataFrame, grupo: str, bandera: str, z: float = 1.96) -> pd.DataFrame:
+    """
+    Motor de tasas por grupo (p. ej. % de superhosts por barrio).
+
+    Con los códigos categóricos de `grupo` se cuentan en una sola pasada
+    (np.bincount) el soporte n y los éxitos de la columna booleana `bandera`.
+    Se añade el intervalo de confianza de Wilson al nivel dado por z,
+    que sigue siendo válido con pocos listings o tasas cercanas a 0 o 100 %.
+
+    Retorna
+    -------
+    DataFrame con grupo, n, exitos, tasa, ic_inf, ic_sup (tasas en %).
+    Los grupos con clave nula se descartan.
+    """
+    codigos, categorias = pd.factorize(df[grupo], sort=True)
+    validos = codigos >= 0
+    codigos = codigos[validos]
+    exitos_fila = df[bandera].to_numpy(dtype=float)[validos]
+
+    n = np.bincount(codigos, minlength=len(categorias))
+    exitos = np.bincount(codigos, weights=exitos_fila, minlength=len(categorias))
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        p = exitos / n
+        z2 = z ** 2
+        centro = (p + z2 / (2 * n)) / (1 + z2 / n)
+        margen = z * np.sqrt(p * (1 - p) / n + z2 / (4 * n ** 2)) / (1 + z2 / n)
+
+    return pd.DataFrame({
+        grupo: categorias,
+        "n": n,
+        "exitos": exitos.astype(np.int64),
+        "tasa": 100 * p,
+        "ic_inf": 100 * np.clip(centro - margen, 0, 1),
+        "ic_sup": 100 * np.clip(centro + margen, 0, 1),
+    })
+
+
+# Percentiles que resumen las distribuciones de ocupación y revenue
+PERCENTILES_OCUPACION = (0.25, 0.5, 0.75)
+
+# Niveles de la tabla de ocupación y revenue
+NIVELES_OCUPACION = {
+    "ciudad": ["ciudad"],
+    "ciudad_barrio": ["ciudad", "barrio_std"],
+}
+
+
+def calcular_ocupacion_revenue(df: pd.DataFrame) -> dict:
+    """
+    Distribuciones de ocupación (fracción del año) y revenue anual estimados
+    por ciudad y por ciudad × barrio, a partir de las columnas por listing
+    ocupacion_estimada y estimated_revenue_l365d.
+
+    Retorna
+    -------
+    dict nivel → DataFrame con n_ocupacion, ocupacion_media, ocupacion_p25/p50/p75,
+    n_revenue, revenue_media y revenue_p25/p50/p75. Las tablas quedan vacías si
+    el dataset no trae esas columnas.
+    """
+    columnas = {"ocupacion_estimada": "ocupacion", "estimated_revenue_l365d": "revenue"}
+    resultado = {}
+
+    for nivel, claves in NIVELES_OCUPACION.items():
+        if not set(claves).issubset(df.columns) or not set(columnas).issubset(df.columns):
+            resultado[nivel] = pd.DataFrame(columns=claves)
+            continue
+
+        g = df[claves + list(columnas)].rename(columns=columnas).groupby(claves, dropna=True)
+        partes = [
+            g.count().add_prefix("n_"),
+            g.mean().add_suffix("_media"),
+        ]
+        for q in PERCENTILES_OCUPACION:
+            partes.append(g.quantile(q).add_suffix(f"_p{int(q * 100)}"))
+
+        tabla = pd.concat(partes, axis=1).reset_index()
+        resultado[nivel] = tabla[tabla["n_ocupacion"] > 0].reset_index(drop=True)
+
+    return resultado
+
+
+@st.cache_data(show_spinner=False)
+def ocupacion_revenue_cacheada(_df: pd.DataFrame, version: str) -> dict:
+    """
+    Versión cacheada de calcular_ocupacion_revenue, con llave la versión de datos.
+    """
+    return calcular_ocupacion_revenue(_df)
+
+
+# Métricas con percentil dentro de la ciudad y del barrio: columna → sufijo
+METRICAS_PERCENTIL = {
+    "price": "precio",
+    "price_per_person": "ppp",
+    "review_scores_rating": "rating",
+    "number_of_reviews_ltm": "reviews",
+    "amenities_count": "amenidades",
+}
+
+# Ámbitos de comparación de los percentiles: nombre → columnas del grupo
+AMBITOS_PERCENTIL = {
+    "ciudad": ["ciudad"],
+    "barrio": ["ciudad", "barrio_std"],
+}
+
+
+def agregar_percentiles(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Agrega, para cada métrica de METRICAS_PERCENTIL y cada ámbito de
+    AMBITOS_PERCENTIL, la columna pctl_<ámbito>_<sufijo> (p. ej.
+    pctl_barrio_precio): el % de listings del grupo con valor menor o
+    igual al del listing (0–100).
+
+    Se usa un rank agrupado por ámbito sobre todas las métricas a la vez.
+    La definición coincide con percentil_de, que responde la misma
+    pregunta para valores nuevos.
+    """
+    d = df.copy()
+    columnas = [c for c in METRICAS_PERCENTIL if c in d.columns]
+
+    for ambito, claves in AMBITOS_PERCENTIL.items():
+        if not set(claves).issubset(d.columns):
+            continue
+        rangos = d.groupby(claves, dropna=True)[columnas].rank(method="max", pct=True)
+        for col in columnas:
+            d[f"pctl_{ambito}_{METRICAS_PERCENTIL[col]}"] = (100 * rangos[col]).astype(np.float32)
+
+    return d
+
+
+def construir_distribuciones(df: pd.DataFrame) -> dict:
+    """
+    Valores ordenados de cada métrica por grupo, para consultas de percentil.
+
+    Por ámbito y métrica se hace un solo ordenamiento (np.lexsort por grupo
+    y valor); cada grupo es después un tramo contiguo de ese arreglo.
+
+    Retorna
+    -------
+    dict ámbito → métrica → {llave del grupo: array ordenado}. La llave es
+    la ciudad en el ámbito "ciudad" y la tupla (ciudad, barrio) en "barrio".
+    """
+    distribuciones = {}
+
+    for ambito, claves in AMBITOS_PERCENTIL.items():
+        distribuciones[ambito] = {}
+        if not set(claves).issubset(df.columns):
+            continue
+
+        g = df.groupby(claves, dropna=True)
+        codigos = g.ngroup().to_numpy(dtype=float)
+        llaves = g.size().index
+
+        for col in METRICAS_PERCENTIL:
+            if col not in df.columns:
+                continue
+            valores = pd.to_numeric(df[col], errors="coerce").to_numpy(dtype=float)
+            validos = ~(np.isnan(valores) | np.isnan(codigos))
+            v, c = valores[validos], codigos[validos].astype(np.int64)
+
+            orden = np.lexsort((v, c))
+            v, c = v[orden], c[orden]
+            limites = np.searchsorted(c, np.arange(len(llaves) + 1))
+
+            distribuciones[ambito][col] = {
+                llave: v[limites[i]:limites[i + 1]] for i, llave in enumerate(llaves)
+            }
+
+    return distribuciones
+
+
+@st.cache_resource(show_spinner=False)
+def distribuciones_cacheadas(_df: pd.DataFrame, version: str) -> dict:
+    """
+    Distribuciones ordenadas construidas una vez por versión de datos y
+    compartidas entre sesiones (no se copian en cada consulta).
+    """
+    return construir_distribuciones(_df)
+
+
+def percentil_de(distribuciones: dict, metrica: str, valores, ciudad: str, barrio: str = None):
+    """
+    % de listings de la ciudad (o del barrio, si se indica) con `metrica`
+    menor o igual a cada valor dado, mediante np.searchsorted sobre los
+    arreglos ordenados de construir_distribuciones.
+
+    Acepta un escalar o un arreglo de valores. Devuelve NaN para valores
+    nulos (como el rank de agregar_percentiles) y si el grupo no existe
+    o no tiene valores.
+    """
+    if barrio is None:
+        orden = distribuciones["ciudad"].get(metrica, {}).get(ciudad)
+    else:
+        orden = distribuciones["barrio"].get(metrica, {}).get((ciudad, barrio))
+
+    valores = np.asarray(valores, dtype=float)
+    if orden is None or not len(orden):
+        return np.full(valores.shape, np.nan)[()]
+
+    pct = 100 * np.searchsorted(orden, valores, side="right") / len(orden)
+    return np.where(np.isnan(valores), np.nan, pct)[()]
@@ -0,0 +1,99 @@
+import os
+import time
+from contextlib import contextmanager
+
+import pandas as pd
+import streamlit as st
+
+from utils.utils_figuras import metricas_figuras
+
+
+# Número máximo de mediciones que se conservan por sección.
+# Se guardan solo las más recientes para no crecer sin límite durante la sesión.
+MAX_MEDICIONES = 50
+
+# Variable de entorno que activa las mediciones y el panel de tiempos.
+# Es una herramienta de desarrollo: por defecto no se mide ni se muestra nada.
+# Ejemplo: MOSTRAR_TIEMPOS=1 streamlit run main.py
+VARIABLE_TIEMPOS = "MOSTRAR_TIEMPOS"
+
+
+def tiempos_activos() -> bool:
+    """
+    Indica si las mediciones de rendimiento están activadas (ver VARIABLE_TIEMPOS).
+    """
+    return os.environ.get(VARIABLE_TIEMPOS, "").strip().lower() in ("1", "true", "si", "sí")
+
+
+@contextmanager
+def medir(etiqueta: str):
+    """
+    Mide el tiempo de ejecución de una sección de la página.
+    Si las mediciones no están activadas (tiempos_activos) no hace nada.
+
+    Cada medición se guarda en st.session_state["_tiempos"] bajo la
+    etiqueta indicada. Al usarse dentro de un fragmento, cada interacción
+    con sus widgets registra únicamente el tiempo del fragmento, lo que
+    permite comparar un rerun completo contra un rerun parcial.
+
+    Uso
+    ---
+    with medir("ROI"):
+        ...
+    """
+    if not tiempos_activos():
+        yield
+        return
+
+    inicio = time.perf_counter()
+    try:
+        yield
+    finally:
+        ms = (time.perf_counter() - inicio) * 1000
+        registro = st.session_state.setdefault("_tiempos", {})
+        valores = registro.setdefault(etiqueta, [])
+        valores.append(ms)
+        del valores[:-MAX_MEDICIONES]
+
+
+def tabla_tiempos() -> pd.DataFrame:
+    """
+    Resume las mediciones registradas en la sesión:
+    número de ejecuciones, último tiempo y mediana en milisegundos.
+    """
+    registro = st.session_state.get("_tiempos", {})
+    filas = [
+        {
+            "sección": etiqueta,
+            "ejecuciones": len(valores),
+            "último (ms)": round(valores[-1], 1),
+            "mediana (ms)": round(float(pd.Series(valores).median()), 1),
+        }
+        for etiqueta, valores in registro.items()
+        if valores
+    ]
+    return pd.DataFrame(filas, columns=["sección", "ejecuciones", "último (ms)", "mediana (ms)"])
+
+
+def render_tiempos():
+    """
+    Muestra en la barra lateral un panel colapsado con los tiempos por sección
+    y las métricas de la caché de figuras. Solo aparece con las mediciones
+    activadas (tiempos_activos).
+    """
+    if not tiempos_activos():
+        return
+
+    with st.sidebar.expander("Tiempos de ejecución"):
+        tabla = tabla_tiempos()
+        if tabla.empty:
+            st.caption("Aún no hay mediciones.")
+        else:
+            st.dataframe(tabla, use_container_width=True, hide_index=True)
+
+        m = metricas_figuras()
+        st.caption(
+            f"Caché de figuras: {m['hit_rate']:.0%} aciertos "
+            f"({m['hits']} hits / {m['misses']} misses), "
+            f"{m['figuras']} figuras, ~{m['mb']:.1f} MB estimados, {m['descartes']} descartadas"
+        )